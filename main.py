@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import sqlite3
 from datetime import datetime, timedelta
 import hashlib
@@ -7,18 +8,45 @@ import smtplib
 import io
 import os
 import base64
+import html
 import json
-import plotly.graph_objects as go
-import plotly.express as px
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
+from email.message import EmailMessage
+from email import policy
 import bcrypt
 import re
 from contextlib import contextmanager
+import threading
+import weakref
+import gc
+from functools import lru_cache
+from dataclasses import dataclass, asdict, fields
+from concurrent.futures import ThreadPoolExecutor
 import warnings
 warnings.filterwarnings('ignore')
 
+# Every widget interaction reruns the script and allocates many short-lived
+# objects, so collect young objects less often. A full collection can be run
+# from Settings.
+GC_GEN0_THRESHOLD = 50000
+
+@st.cache_resource
+def configure_gc():
+    """Raise the young-generation gc threshold once per server process"""
+    gc.set_threshold(GC_GEN0_THRESHOLD, *gc.get_threshold()[1:])
+    return True
+
+configure_gc()
+
+# Fragments scope reruns to a block of widgets; older Streamlit releases only
+# ship the experimental name, so fall back to a plain function call there.
+_native_fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+fragment = _native_fragment or (lambda func: func)
+# A fragment that reruns itself every second, used to poll background work
+polling_fragment = _native_fragment(run_every=1) if _native_fragment else (lambda func: func)
+
 # ============================================================================
 # CONSTANTS AND CONFIGURATION
 # ============================================================================
@@ -31,10 +59,141 @@ CURRENCIES = {
     'CAD': {'symbol': 'C$', 'name': 'Canadian Dollar'},
     'JMD': {'symbol': 'J$', 'name': 'Jamaican Dollar'}
 }
+CURRENCY_SYMBOLS = {code: info['symbol'] for code, info in CURRENCIES.items()}
+# Currency selectbox options, their positions and display labels
+CURRENCY_CODES = tuple(CURRENCIES)
+CURRENCY_INDEX = {code: index for index, code in enumerate(CURRENCY_CODES)}
+CURRENCY_LABELS = {code: f"{info['symbol']} {info['name']}" for code, info in CURRENCIES.items()}
+
+STREAMLIT_VERSION = tuple(int(part) for part in st.__version__.split('.')[:2])
+# Streamlit 1.52+ accepts a callable as download data and only calls it on click
+LAZY_DOWNLOADS = STREAMLIT_VERSION >= (1, 52)
+# Streamlit 1.35+ reports the rows selected in an st.dataframe
+DATAFRAME_SELECTION = STREAMLIT_VERSION >= (1, 35)
 
 INVOICE_STATUSES = ['Draft', 'Sent', 'Paid', 'Overdue', 'Cancelled']
 PAYMENT_METHODS = ['Cash', 'Bank Transfer', 'Credit Card', 'Cheque', 'Online Payment']
 
+# Invoices with at least this many items have their totals computed with NumPy
+VECTORIZED_TOTALS_MIN_ITEMS = 50
+
+# Invoice cards rendered per page on the View Invoices page
+INVOICES_PAGE_SIZE = 20
+# Columns shown in an invoice list row; any change to them changes the row fingerprint
+INVOICE_ROW_COLUMNS = ['invoice_number', 'client_name', 'invoice_date', 'due_date',
+                       'grand_total_fmt', 'balance_due_fmt', 'status']
+
+# Payment list columns and their headings when shown as a selectable table
+PAYMENT_TABLE_COLUMNS = {
+    'invoice_number': 'Invoice',
+    'client_name': 'Client',
+    'amount_fmt': 'Amount',
+    'payment_method': 'Method',
+    'payment_date_fmt': 'Date',
+    'reference': 'Reference'
+}
+
+# Leading bytes of the logo formats the uploader accepts; file extensions are not checked content
+LOGO_SIGNATURES = (b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff')
+
+# Aging bucket for a query exposing a days_overdue column
+AGING_CATEGORY_SQL = """CASE
+    WHEN days_overdue <= 0 THEN 'Current'
+    WHEN days_overdue <= 30 THEN '1-30 days'
+    WHEN days_overdue <= 60 THEN '31-60 days'
+    WHEN days_overdue <= 90 THEN '61-90 days'
+    ELSE '90+ days'
+END"""
+
+# Report queries; the date-ranged ones take :start and :end as ISO dates
+SQL_REVENUE = """
+    SELECT 
+        strftime('%Y-%m', invoice_date) as period,
+        COUNT(*) as invoice_count,
+        SUM(CASE WHEN status = 'Paid' THEN grand_total ELSE 0 END) as paid_revenue,
+        SUM(CASE WHEN status != 'Paid' THEN grand_total ELSE 0 END) as pending_revenue,
+        SUM(grand_total) as total_revenue
+    FROM invoices
+    WHERE invoice_date BETWEEN :start AND :end
+    GROUP BY strftime('%Y-%m', invoice_date)
+    ORDER BY period
+"""
+# Open invoices with days overdue as of the given date
+SQL_OPEN_INVOICES = """
+    SELECT 
+        client_name,
+        invoice_number,
+        invoice_date,
+        due_date,
+        grand_total,
+        amount_paid,
+        balance_due,
+        julianday(:today) - julianday(due_date) as days_overdue
+    FROM invoices
+    WHERE status NOT IN ('Paid', 'Cancelled')
+"""
+SQL_AGING = f"""
+    SELECT {AGING_CATEGORY_SQL} as aging_category, SUM(balance_due) as balance_due
+    FROM ({SQL_OPEN_INVOICES})
+    GROUP BY aging_category
+    ORDER BY MIN(days_overdue)
+"""
+SQL_AGING_DETAIL = f"""
+    SELECT *, {AGING_CATEGORY_SQL} as aging_category
+    FROM ({SQL_OPEN_INVOICES})
+    ORDER BY days_overdue DESC
+"""
+SQL_CLIENT_SUMMARY = """
+    SELECT 
+        i.client_name,
+        COUNT(*) as invoice_count,
+        SUM(CASE WHEN i.status = 'Paid' THEN i.grand_total ELSE 0 END) as paid_amount,
+        SUM(CASE WHEN i.status != 'Paid' THEN i.grand_total ELSE 0 END) as pending_amount,
+        SUM(i.grand_total) as total_amount,
+        AVG(i.grand_total) as avg_invoice,
+        MAX(i.invoice_date) as last_invoice
+    FROM invoices i
+    WHERE i.invoice_date BETWEEN :start AND :end
+    GROUP BY i.client_name
+    ORDER BY total_amount DESC
+"""
+SQL_TAX_SUMMARY = """
+    SELECT 
+        strftime('%Y-%m', i.invoice_date) as period,
+        COUNT(DISTINCT i.id) as invoice_count,
+        SUM(ii.tax_amount) as total_tax_collected,
+        SUM(i.grand_total) as total_revenue,
+        (SUM(ii.tax_amount) / SUM(i.grand_total) * 100) as avg_tax_rate
+    FROM invoices i
+    JOIN invoice_items ii ON i.id = ii.invoice_id
+    WHERE i.invoice_date BETWEEN :start AND :end
+    GROUP BY strftime('%Y-%m', i.invoice_date)
+    ORDER BY period
+"""
+SQL_PAYMENT_METHODS = """
+    SELECT 
+        p.payment_method,
+        COUNT(*) as payment_count,
+        SUM(p.amount) as total_amount,
+        AVG(p.amount) as avg_amount,
+        MIN(p.payment_date) as first_use,
+        MAX(p.payment_date) as last_use
+    FROM payments p
+    WHERE p.payment_date BETWEEN :start AND :end
+    GROUP BY p.payment_method
+    ORDER BY total_amount DESC
+"""
+
+# A single fixed statement, so SQLite compiles it once and reuses it on every save
+SQL_UPDATE_COMPANY_SETTINGS = """
+    UPDATE company_settings
+    SET name = :name, address = :address, city = :city, phone = :phone,
+        email = :email, tax_id = :tax_id, bank_details = :bank_details,
+        default_currency = :default_currency, vat_registered = :vat_registered,
+        invoice_prefix = :invoice_prefix, updated_at = :updated_at
+    WHERE id = 1
+"""
+
 RECURRING_FREQUENCIES = {
     'None': None,
     'Daily': 1,
@@ -48,20 +207,47 @@ RECURRING_FREQUENCIES = {
 # DATABASE CONNECTION
 # ============================================================================
 
+@st.cache_resource
+def get_connection_pool():
+    """Get the per-thread store of open database connections"""
+    return threading.local()
+
+def open_db_connection():
+    """Open a database connection tuned for this app"""
+    conn = sqlite3.connect('invoices.db', cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    # Keep hot pages in memory: a 20 MB page cache plus up to 256 MB memory-mapped
+    conn.execute("PRAGMA cache_size = -20000")
+    conn.execute("PRAGMA mmap_size = 268435456")
+    # Write-ahead logging lets backups and readers run alongside writes, and
+    # NORMAL sync only fsyncs the log at checkpoints instead of on every commit
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA wal_autocheckpoint = 1000")
+    return conn
+
 @contextmanager
 def get_db_connection():
     """Get database connection with context manager"""
-    conn = None
+    local = None
     try:
-        conn = sqlite3.connect('invoices.db')
-        conn.row_factory = sqlite3.Row
-        yield conn
+        # Each thread keeps its own connection open, so its prepared statements
+        # are reused across queries without serialising other sessions behind it
+        local = get_connection_pool()
+        if getattr(local, 'conn', None) is None:
+            local.conn = open_db_connection()
+            local.depth = 0
+        local.depth += 1
+        yield local.conn
     except sqlite3.Error as e:
         st.error(f"Database connection error: {e}")
         raise
     finally:
-        if conn:
-            conn.close()
+        if local is not None and getattr(local, 'conn', None) is not None:
+            local.depth -= 1
+            # Never leave a half-finished transaction behind for the next query
+            if local.depth == 0 and local.conn.in_transaction:
+                local.conn.rollback()
 
 def init_database():
     """Initialize database tables"""
@@ -83,6 +269,7 @@ def init_database():
                 vat_registered BOOLEAN,
                 invoice_prefix TEXT,
                 logo_base64 TEXT,
+                company_logo BLOB,
                 updated_at TEXT
             )''')
             
@@ -128,6 +315,10 @@ def init_database():
                 recurring_frequency TEXT,
                 recurring_next_date TEXT
             )''')
+            c.execute('''CREATE INDEX IF NOT EXISTS idx_invoices_status_date_client
+                         ON invoices (status, invoice_date, client_name)''')
+            c.execute('''CREATE INDEX IF NOT EXISTS idx_invoices_client_date
+                         ON invoices (client_name, invoice_date)''')
             
             # Create invoice_items table
             c.execute('''CREATE TABLE IF NOT EXISTS invoice_items (
@@ -227,10 +418,35 @@ def init_database():
                     ('admin', default_password, 'admin@example.com', 'admin', 'System Administrator', 
                      datetime.now().isoformat()))
             
+            migrate_company_logo(c)
+            ensure_report_indexes(c)
             conn.commit()
     except Exception as e:
         st.error(f"Database initialization error: {e}")
 
+def migrate_company_logo(c):
+    """Move a base64 logo saved by older versions into the company_logo BLOB column"""
+    columns = [row[1] for row in c.execute("PRAGMA table_info(company_settings)")]
+    if 'company_logo' not in columns:
+        c.execute("ALTER TABLE company_settings ADD COLUMN company_logo BLOB")
+    c.execute("SELECT id, logo_base64 FROM company_settings WHERE logo_base64 IS NOT NULL")
+    for settings_id, logo_base64 in c.fetchall():
+        c.execute("UPDATE company_settings SET company_logo = ?, logo_base64 = NULL WHERE id = ?",
+                  (base64.b64decode(logo_base64), settings_id))
+
+def ensure_report_indexes(c):
+    """Create the indexes used by the report, payment, item and audit log lookups"""
+    c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_invoice_date ON invoices (invoice_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice ON invoice_items (invoice_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_payments_invoice ON payments (invoice_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_payments_date ON payments (payment_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_payments_method ON payments (payment_method)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_audit_timestamp ON audit_log (timestamp DESC)")
+    # Covers the quick payment picker so it never touches the invoice rows
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_invoices_status_unpaid
+                 ON invoices (status, created_at, invoice_number, client_name,
+                              grand_total, amount_paid, balance_due, currency)''')
+
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
@@ -238,15 +454,34 @@ def init_database():
 def format_amount(amount, currency='TTD'):
     """Format amount with currency symbol"""
     try:
-        amount = float(amount)
-        symbol = CURRENCIES.get(currency, {'symbol': '$'})['symbol']
-        return f"{symbol}{amount:,.2f}"
+        amount = round(float(amount), 2)
     except (ValueError, TypeError):
-        return f"{CURRENCIES.get(currency, {'symbol': '$'})['symbol']}0.00"
+        amount = 0.0
+    return get_amount_formatter()(amount, currency)
+
+@st.cache_resource
+def get_amount_formatter():
+    """Get the memoized amount formatter, built once per process so it outlives reruns"""
+    # Each rerun executes this module afresh, so a module-level lru_cache would start empty every time
+    @lru_cache(maxsize=1024)
+    def format_rounded_amount(amount, currency):
+        return f"{CURRENCY_SYMBOLS.get(currency, '$')}{amount:,.2f}"
+    return format_rounded_amount
+
+def format_amount_vec(amounts, currencies):
+    """Format a column of amounts with their currency symbols in one pass"""
+    if len(amounts) == 0:
+        return pd.Series(index=amounts.index, dtype=object)
+    if isinstance(currencies, pd.Series):
+        symbols = currencies.map(CURRENCY_SYMBOLS).fillna('$')
+    else:
+        symbols = CURRENCY_SYMBOLS.get(currencies, '$')
+    numbers = pd.to_numeric(amounts, errors='coerce').fillna(0.0).round(2)
+    return symbols + numbers.map('{:,.2f}'.format)
 
 def get_currency_symbol(currency):
     """Get currency symbol"""
-    return CURRENCIES.get(currency, {'symbol': '$'})['symbol']
+    return CURRENCY_SYMBOLS.get(currency, '$')
 
 def generate_invoice_number():
     """Generate unique invoice number"""
@@ -254,6 +489,32 @@ def generate_invoice_number():
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
     return f"{prefix}-{timestamp}"
 
+def compute_invoice_totals(items):
+    """Compute subtotal, discount, tax and grand total for invoice items"""
+    if len(items) >= VECTORIZED_TOTALS_MIN_ITEMS:
+        values = np.fromiter(
+            ((item['quantity'], item['unit_price'], item['discount'], item['tax_rate']) for item in items),
+            dtype=np.dtype((np.float64, 4)),
+            count=len(items)
+        )
+        line_amounts = values[:, 0] * values[:, 1]
+        subtotal = float(line_amounts.sum())
+        total_discount = float((line_amounts * values[:, 2]).sum() / 100)
+        total_tax = (subtotal - total_discount) * float(values[:, 3].sum()) / 100
+        return subtotal, total_discount, total_tax, subtotal - total_discount + total_tax
+    
+    # One pass over the items collects every running sum
+    subtotal = total_discount = total_tax_rate = 0
+    for item in items:
+        line_amount = item['quantity'] * item['unit_price']
+        subtotal += line_amount
+        total_discount += line_amount * (item['discount'] / 100)
+        total_tax_rate += item['tax_rate']
+    taxable_amount = subtotal - total_discount
+    total_tax = taxable_amount * total_tax_rate / 100
+    grand_total = subtotal - total_discount + total_tax
+    return subtotal, total_discount, total_tax, grand_total
+
 def hash_password(password):
     """Hash password with bcrypt"""
     salt = bcrypt.gensalt()
@@ -296,43 +557,97 @@ def get_cached_data(query, params=None):
             return pd.read_sql_query(query, conn, params=params)
         return pd.read_sql_query(query, conn)
 
+def lazy_download_button(prepare_label, label, build_data, file_name, mime, key=None):
+    """Render a download button that only builds its file when requested"""
+    if LAZY_DOWNLOADS:
+        st.download_button(
+            label=prepare_label,
+            data=lambda: build_data() or b"",
+            file_name=file_name,
+            mime=mime,
+            key=key,
+            use_container_width=True
+        )
+    elif st.button(prepare_label, key=f"prepare_{key}" if key else None, use_container_width=True):
+        # Older releases need the file up front, so build it behind a first click
+        data = build_data()
+        if data:
+            st.download_button(
+                label=label,
+                data=data,
+                file_name=file_name,
+                mime=mime,
+                key=key,
+                use_container_width=True
+            )
+
 def paginate_dataframe(df, page_size=10, key="default"):
     """Paginate dataframe display"""
     if df.empty:
         return df
     
-    total_pages = len(df) // page_size + (1 if len(df) % page_size else 0)
+    start = render_pagination(len(df), page_size, key)
+    return df.iloc[start:start + page_size]
+
+def render_pagination(total_rows, page_size=10, key="default"):
+    """Render page controls and return the offset of the first row on the current page"""
+    offset = get_page_offset(total_rows, page_size, key)
+    render_page_controls(total_rows, page_size, key)
+    return offset
+
+def get_page_offset(total_rows, page_size=10, key="default"):
+    """Get the offset of the first row on the current page"""
+    total_pages = total_rows // page_size + (1 if total_rows % page_size else 0)
     page_key = f"page_num_{key}"
     
     if page_key not in st.session_state:
         st.session_state[page_key] = 0
     
+    # Filters can shrink the result set under the remembered page
+    st.session_state[page_key] = min(st.session_state[page_key], max(total_pages - 1, 0))
+    return st.session_state[page_key] * page_size
+
+def set_state(**values):
+    """Set session state values (button callback)"""
+    for key, value in values.items():
+        st.session_state[key] = value
+
+def change_page(page_key, step):
+    """Move a paginated list by step pages (button callback)"""
+    st.session_state[page_key] += step
+
+def render_page_controls(total_rows, page_size=10, key="default"):
+    """Render Previous/Next controls for a paginated list"""
+    total_pages = total_rows // page_size + (1 if total_rows % page_size else 0)
+    page_key = f"page_num_{key}"
+    page = st.session_state[page_key]
+    
+    # Callbacks run before the next script run, so the controls can sit below the rows
     col1, col2, col3 = st.columns([1, 2, 1])
     with col1:
-        if st.button("◀ Previous", key=f"prev_{key}") and st.session_state[page_key] > 0:
-            st.session_state[page_key] -= 1
+        st.button("◀ Previous", key=f"prev_{key}", on_click=change_page,
+                  args=(page_key, -1), disabled=page <= 0)
     with col2:
-        st.write(f"Page {st.session_state[page_key] + 1} of {total_pages}")
+        st.write(f"Page {page + 1} of {total_pages}")
     with col3:
-        if st.button("Next ▶", key=f"next_{key}") and st.session_state[page_key] < total_pages - 1:
-            st.session_state[page_key] += 1
-    
-    start = st.session_state[page_key] * page_size
-    end = start + page_size
-    return df.iloc[start:end]
+        st.button("Next ▶", key=f"next_{key}", on_click=change_page,
+                  args=(page_key, 1), disabled=page >= total_pages - 1)
+
+def insert_audit_entry(c, action, table_name=None, record_id=None, old_value=None, new_value=None):
+    """Insert audit entry using an open cursor"""
+    c.execute('''INSERT INTO audit_log 
+                (user_id, action, table_name, record_id, old_value, new_value, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)''',
+             (st.session_state.get('user_id', 1), action, table_name, record_id,
+              json.dumps(old_value) if old_value else None,
+              json.dumps(new_value) if new_value else None,
+              datetime.now().isoformat()))
 
 def log_audit(action, table_name=None, record_id=None, old_value=None, new_value=None):
     """Log audit entry"""
     try:
         with get_db_connection() as conn:
-            c = conn.cursor()
-            c.execute('''INSERT INTO audit_log 
-                        (user_id, action, table_name, record_id, old_value, new_value, timestamp)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                     (st.session_state.get('user_id', 1), action, table_name, record_id,
-                      json.dumps(old_value) if old_value else None,
-                      json.dumps(new_value) if new_value else None,
-                      datetime.now().isoformat()))
+            insert_audit_entry(conn.cursor(), action, table_name, record_id, old_value, new_value)
             conn.commit()
     except Exception as e:
         print(f"Audit log error: {e}")
@@ -349,40 +664,85 @@ def get_status_badge_html(status):
     color = colors.get(status, '#95a5a6')
     return f'<span style="background-color: {color}; color: white; padding: 3px 10px; border-radius: 12px; font-size: 12px;">{status}</span>'
 
+# Badge markup for every known status, built once at import
+STATUS_BADGE_HTML = {status: get_status_badge_html(status) for status in INVOICE_STATUSES}
+
 def save_logo(uploaded_file):
     """Save uploaded logo"""
     try:
         if uploaded_file is not None:
+            # Raw bytes are a third smaller than base64; it is only encoded for HTML
             bytes_data = uploaded_file.getvalue()
-            base64_data = base64.b64encode(bytes_data).decode()
-            st.session_state.company_info['logo_base64'] = base64_data
+            if not bytes_data.startswith(LOGO_SIGNATURES):
+                st.error("Logo must be a PNG or JPEG image")
+                return False
+            # The uploader keeps its file across reruns, so only the first one writes it
+            if bytes_data == st.session_state.company_info.get('company_logo'):
+                return True
+            st.session_state.company_info['company_logo'] = bytes_data
+            st.session_state.company_info['logo_digest'] = get_logo_digest(bytes_data)
             
             with get_db_connection() as conn:
                 c = conn.cursor()
                 c.execute('''UPDATE company_settings 
-                           SET logo_base64 = ?, updated_at = ?
+                           SET company_logo = ?, updated_at = ?
                            WHERE id = 1''',
-                         (base64_data, datetime.now().isoformat()))
+                         (bytes_data, datetime.now().isoformat()))
                 conn.commit()
             return True
     except Exception as e:
         st.error(f"Error saving logo: {e}")
         return False
 
+def get_totals_table_html(rows):
+    """Get HTML table for totals rows of (label, value[, row class])"""
+    body = ''.join(
+        f'<tr class="{row[2] if len(row) > 2 else ""}"><td>{row[0]}</td><td>{row[1]}</td></tr>'
+        for row in rows
+    )
+    return f'<table class="totals-table">{body}</table>'
+
+@st.cache_data(max_entries=2048, show_spinner=False)
+def get_invoice_row_html(fingerprint, _invoice):
+    """Get HTML for the static columns of an invoice list row, cached on its fingerprint"""
+    # Every field is user data going into raw HTML, so escape it first
+    row = {column: html.escape(str(_invoice[column])) for column in INVOICE_ROW_COLUMNS}
+    balance = f'<small>Balance: {row["balance_due_fmt"]}</small>' if _invoice['balance_due_fmt'] else ''
+    overdue = '<small>⚠️ Overdue</small>' if _invoice['status'] == 'Overdue' else ''
+    return f"""<div class="invoice-row">
+        <div><strong>{row['invoice_number']}</strong><small>Client: {row['client_name']}</small></div>
+        <div><span><strong>Date:</strong> {row['invoice_date']}</span><span><strong>Due:</strong> {row['due_date']}</span></div>
+        <div><span><strong>Amount:</strong> {row['grand_total_fmt']}</span>{balance}</div>
+        <div>{STATUS_BADGE_HTML.get(_invoice['status']) or get_status_badge_html(row['status'])}{overdue}</div>
+    </div>"""
+
+def get_logo_digest(logo_bytes):
+    """Get the digest identifying a logo in caches, or None without a logo"""
+    return hashlib.sha256(logo_bytes).hexdigest() if logo_bytes else None
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def get_logo_img_html(logo_digest, _logo_bytes, height, width):
+    """Get the <img> tag embedding logo bytes, cached per logo digest and display size"""
+    mime = 'image/png' if _logo_bytes.startswith(LOGO_SIGNATURES[0]) else 'image/jpeg'
+    data_uri = f"data:{mime};base64,{base64.b64encode(_logo_bytes).decode()}"
+    return f'<img src="{data_uri}" style="height: {height}; width: {width}; object-fit: contain;">'
+
 def get_logo_html(height="50px", width="auto"):
     """Get HTML for logo display"""
-    if st.session_state.company_info.get('logo_base64'):
-        return f'<img src="data:image/png;base64,{st.session_state.company_info["logo_base64"]}" style="height: {height}; width: {width}; object-fit: contain;">'
+    company_info = st.session_state.company_info
+    if company_info.get('company_logo'):
+        return get_logo_img_html(company_info['logo_digest'], company_info['company_logo'], height, width)
     return ""
 
 def remove_logo():
     """Remove company logo"""
     try:
-        st.session_state.company_info['logo_base64'] = None
+        st.session_state.company_info['company_logo'] = None
+        st.session_state.company_info['logo_digest'] = None
         with get_db_connection() as conn:
             c = conn.cursor()
             c.execute('''UPDATE company_settings 
-                       SET logo_base64 = NULL, updated_at = ?
+                       SET company_logo = NULL, updated_at = ?
                        WHERE id = 1''',
                      (datetime.now().isoformat(),))
             conn.commit()
@@ -395,9 +755,66 @@ def remove_logo():
 # DATABASE OPERATIONS
 # ============================================================================
 
-@safe_db_operation
+def add_user(username, password, email, role, full_name, is_active):
+    """Hash the password and insert a user (runs in the background I/O pool)"""
+    try:
+        password_hash = hash_password(password)
+        with get_db_connection() as conn:
+            c = conn.cursor()
+            c.execute('''INSERT INTO users 
+                       (username, password_hash, email, role, full_name, is_active, created_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                     (username, password_hash, email, role, full_name, is_active,
+                      datetime.now().isoformat()))
+            conn.commit()
+        return True, f"✓ User {username} added"
+    except sqlite3.IntegrityError:
+        return False, "Username or email already exists"
+    except Exception as e:
+        return False, f"Error adding user: {e}"
+
+def insert_invoice_rows(c, invoice_data, items):
+    """Insert invoice and its items using an open cursor"""
+    c.execute('''INSERT INTO invoices 
+                (invoice_number, client_name, client_email, client_address, client_phone,
+                 invoice_date, due_date, po_number, currency, subtotal, tax_total,
+                 discount_total, grand_total, amount_paid, balance_due, status,
+                 notes, sent_date, recurring_frequency, recurring_next_date,
+                 created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+             (invoice_data['invoice_number'], invoice_data['client_name'],
+              invoice_data.get('client_email'), invoice_data.get('client_address'),
+              invoice_data.get('client_phone'), invoice_data['invoice_date'],
+              invoice_data['due_date'], invoice_data.get('po_number'),
+              invoice_data['currency'], invoice_data['subtotal'],
+              invoice_data['tax_total'], invoice_data['discount_total'],
+              invoice_data['grand_total'], invoice_data.get('amount_paid', 0),
+              invoice_data.get('balance_due', invoice_data['grand_total']),
+              invoice_data['status'], invoice_data.get('notes'),
+              invoice_data.get('sent_date'), invoice_data.get('recurring_frequency'),
+              invoice_data.get('recurring_next_date'), datetime.now().isoformat(),
+              datetime.now().isoformat()))
+    
+    invoice_id = c.lastrowid
+    
+    # Insert items
+    for item in items:
+        c.execute('''INSERT INTO invoice_items 
+                    (invoice_id, description, quantity, unit_price, tax_rate, discount, total)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                 (invoice_id, item['description'], item['quantity'],
+                  item['unit_price'], item['tax_rate'], item['discount'],
+                  item['total']))
+    
+    return invoice_id
+
 def save_invoice_to_db(invoice_data, items):
     """Save invoice to database"""
+    return save_invoice_and_client(invoice_data, items)
+
+@safe_db_operation
+def save_invoice_and_client(invoice_data, items, client_data=None):
+    """Save invoice and optionally upsert its client in a single transaction"""
     errors = []
     warnings = []
     invoice_id = None
@@ -405,51 +822,29 @@ def save_invoice_to_db(invoice_data, items):
     try:
         with get_db_connection() as conn:
             c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
             
-            # Insert invoice
-            c.execute('''INSERT INTO invoices 
-                        (invoice_number, client_name, client_email, client_address, client_phone,
-                         invoice_date, due_date, po_number, currency, subtotal, tax_total,
-                         discount_total, grand_total, amount_paid, balance_due, status,
-                         notes, sent_date, recurring_frequency, recurring_next_date,
-                         created_at, updated_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                     (invoice_data['invoice_number'], invoice_data['client_name'],
-                      invoice_data.get('client_email'), invoice_data.get('client_address'),
-                      invoice_data.get('client_phone'), invoice_data['invoice_date'],
-                      invoice_data['due_date'], invoice_data.get('po_number'),
-                      invoice_data['currency'], invoice_data['subtotal'],
-                      invoice_data['tax_total'], invoice_data['discount_total'],
-                      invoice_data['grand_total'], invoice_data.get('amount_paid', 0),
-                      invoice_data.get('balance_due', invoice_data['grand_total']),
-                      invoice_data['status'], invoice_data.get('notes'),
-                      invoice_data.get('sent_date'), invoice_data.get('recurring_frequency'),
-                      invoice_data.get('recurring_next_date'), datetime.now().isoformat(),
-                      datetime.now().isoformat()))
-            
-            invoice_id = c.lastrowid
+            invoice_id = insert_invoice_rows(c, invoice_data, items)
+            insert_audit_entry(c, 'CREATE', 'invoices', invoice_id, None, invoice_data)
             
-            # Insert items
-            for item in items:
-                c.execute('''INSERT INTO invoice_items 
-                            (invoice_id, description, quantity, unit_price, tax_rate, discount, total)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                         (invoice_id, item['description'], item['quantity'],
-                          item['unit_price'], item['tax_rate'], item['discount'],
-                          item['total']))
+            if client_data:
+                client_id, existing = upsert_client_row(c, client_data)
+                insert_audit_entry(c, 'UPDATE' if existing else 'CREATE', 'clients', client_id, None, client_data)
             
             conn.commit()
-            log_audit('CREATE', 'invoices', invoice_id, None, invoice_data)
+        
+        clear_invoice_caches()
+        if client_data:
+            clear_client_caches()
             
     except Exception as e:
+        invoice_id = None
         errors.append(str(e))
     
     return invoice_id, errors, warnings
 
-@safe_db_operation
-def get_invoices(filters=None):
-    """Get invoices with optional filters"""
-    query = "SELECT * FROM invoices"
+def build_invoice_conditions(filters):
+    """Build the WHERE clause and parameters for invoice filters"""
     params = []
     
     if filters:
@@ -460,21 +855,110 @@ def get_invoices(filters=None):
         if filters.get('client_name'):
             conditions.append("client_name LIKE ?")
             params.append(f"%{filters['client_name']}%")
-        if filters.get('date_from'):
+        # ISO date strings compare correctly as text, so they are bound as-is
+        if filters.get('date_from') and filters.get('date_to'):
+            conditions.append("invoice_date BETWEEN ? AND ?")
+            params.extend([filters['date_from'], filters['date_to']])
+        elif filters.get('date_from'):
             conditions.append("invoice_date >= ?")
             params.append(filters['date_from'])
-        if filters.get('date_to'):
+        elif filters.get('date_to'):
             conditions.append("invoice_date <= ?")
             params.append(filters['date_to'])
         
         if conditions:
-            query += " WHERE " + " AND ".join(conditions)
+            return " WHERE " + " AND ".join(conditions), params
     
-    query += " ORDER BY created_at DESC"
+    return "", params
+
+@safe_db_operation
+def get_invoices(filters=None, limit=None, offset=0):
+    """Get invoices with optional filters"""
+    where, params = build_invoice_conditions(filters)
+    query = "SELECT * FROM invoices" + where + " ORDER BY created_at DESC"
+    
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params += [limit, offset]
     
     with get_db_connection() as conn:
         return pd.read_sql_query(query, conn, params=params)
 
+@safe_db_operation
+def get_invoice_summary(filters=None):
+    """Get invoice count and amount totals with optional filters"""
+    where, params = build_invoice_conditions(filters)
+    query = """SELECT COUNT(*),
+                      COALESCE(SUM(grand_total), 0),
+                      COALESCE(SUM(CASE WHEN status = 'Paid' THEN grand_total ELSE 0 END), 0),
+                      COALESCE(SUM(CASE WHEN status IN ('Draft', 'Sent') THEN grand_total ELSE 0 END), 0)
+               FROM invoices""" + where
+    
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(query, params)
+        count, total, paid, pending = c.fetchone()
+    
+    return {'count': count, 'total': total, 'paid': paid, 'pending': pending}
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_invoices(filters_key, limit=None, offset=0):
+    """Get invoices for a canonical filters key, cached between reruns"""
+    return get_invoices(dict(filters_key) if filters_key else None, limit, offset)
+
+def get_cached_invoices(filters=None, limit=None, offset=0):
+    """Get invoices with optional filters, reusing results until invoices change"""
+    return _cached_invoices(tuple(sorted(filters.items())) if filters else (), limit, offset)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_invoice_summary(filters_key):
+    """Get invoice totals for a canonical filters key, cached between reruns"""
+    return get_invoice_summary(dict(filters_key) if filters_key else None)
+
+def get_cached_invoice_summary(filters=None):
+    """Get invoice totals with optional filters, reusing results until invoices change"""
+    return _cached_invoice_summary(tuple(sorted(filters.items())) if filters else ())
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_recent_client_invoices(client_name, limit=3):
+    """Get a client's most recent invoices, cached between reruns"""
+    with get_db_connection() as conn:
+        return pd.read_sql_query(
+            "SELECT * FROM invoices WHERE client_name = ? ORDER BY invoice_date DESC LIMIT ?",
+            conn, params=[client_name, limit]
+        )
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_unpaid_invoices():
+    """Get the sent invoices offered for a quick payment, newest first"""
+    with get_db_connection() as conn:
+        return pd.read_sql_query("""
+            SELECT id, invoice_number, client_name, grand_total, amount_paid, balance_due, currency
+            FROM invoices
+            WHERE status = 'Sent'
+            ORDER BY created_at DESC
+        """, conn)
+
+@st.cache_resource
+def get_invoice_data_version():
+    """Get the app-wide counter bumped whenever invoice data changes"""
+    return {'value': 0}
+
+def clear_invoice_caches():
+    """Invalidate cached invoice queries after a write"""
+    # Lets per-session copies notice writes made from any session
+    get_invoice_data_version()['value'] += 1
+    _cached_invoices.clear()
+    _cached_invoice_summary.clear()
+    get_recent_client_invoices.clear()
+    get_unpaid_invoices.clear()
+    _cached_invoice_by_id.clear()
+    # Payments and reports read invoice columns too
+    get_cached_payments.clear()
+    get_cached_payment_stats.clear()
+    get_cached_report.clear()
+    get_cached_report_table.clear()
+
 @safe_db_operation
 def get_invoice_by_id(invoice_id):
     """Get invoice by ID"""
@@ -490,6 +974,15 @@ def get_invoice_by_id(invoice_id):
     
     return None, None
 
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_invoice_by_id(invoice_id):
+    """Get invoice and items by ID, cached between reruns"""
+    return get_invoice_by_id(invoice_id)
+
+def get_cached_invoice_by_id(invoice_id):
+    """Get invoice by ID, reusing the result until invoices change"""
+    return _cached_invoice_by_id(int(invoice_id))
+
 @safe_db_operation
 def update_invoice_status(invoice_id, new_status):
     """Update invoice status"""
@@ -500,6 +993,7 @@ def update_invoice_status(invoice_id, new_status):
                     WHERE id = ?''',
                  (new_status, datetime.now().isoformat(), invoice_id))
         conn.commit()
+        clear_invoice_caches()
         log_audit('UPDATE', 'invoices', invoice_id, {'status': 'old'}, {'status': new_status})
         return True
 
@@ -510,48 +1004,54 @@ def delete_invoice(invoice_id):
         c = conn.cursor()
         c.execute("DELETE FROM invoices WHERE id = ?", (invoice_id,))
         conn.commit()
+        clear_invoice_caches()
         log_audit('DELETE', 'invoices', invoice_id)
         return True
 
+def upsert_client_row(c, client_data):
+    """Insert or update client by email using an open cursor"""
+    # Check if client exists
+    c.execute("SELECT id FROM clients WHERE email = ?", (client_data['email'],))
+    existing = c.fetchone()
+    
+    if existing:
+        # Update existing client
+        c.execute('''UPDATE clients 
+                    SET name = ?, phone = ?, address = ?, company = ?,
+                        tax_id = ?, notes = ?, credit_limit = ?, payment_terms = ?,
+                        updated_at = ?
+                    WHERE email = ?''',
+                 (client_data['name'], client_data.get('phone'),
+                  client_data.get('address'), client_data.get('company'),
+                  client_data.get('tax_id'), client_data.get('notes'),
+                  client_data.get('credit_limit', 0),
+                  client_data.get('payment_terms', 30),
+                  datetime.now().isoformat(), client_data['email']))
+        client_id = existing[0]
+    else:
+        # Insert new client
+        c.execute('''INSERT INTO clients 
+                    (name, email, phone, address, company, tax_id, notes,
+                     credit_limit, payment_terms, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                 (client_data['name'], client_data['email'],
+                  client_data.get('phone'), client_data.get('address'),
+                  client_data.get('company'), client_data.get('tax_id'),
+                  client_data.get('notes'), client_data.get('credit_limit', 0),
+                  client_data.get('payment_terms', 30),
+                  datetime.now().isoformat(), datetime.now().isoformat()))
+        client_id = c.lastrowid
+    
+    return client_id, existing is not None
+
 @safe_db_operation
 def save_client_to_db(client_data):
     """Save client to database"""
     with get_db_connection() as conn:
         c = conn.cursor()
-        
-        # Check if client exists
-        c.execute("SELECT id FROM clients WHERE email = ?", (client_data['email'],))
-        existing = c.fetchone()
-        
-        if existing:
-            # Update existing client
-            c.execute('''UPDATE clients 
-                        SET name = ?, phone = ?, address = ?, company = ?,
-                            tax_id = ?, notes = ?, credit_limit = ?, payment_terms = ?,
-                            updated_at = ?
-                        WHERE email = ?''',
-                     (client_data['name'], client_data.get('phone'),
-                      client_data.get('address'), client_data.get('company'),
-                      client_data.get('tax_id'), client_data.get('notes'),
-                      client_data.get('credit_limit', 0),
-                      client_data.get('payment_terms', 30),
-                      datetime.now().isoformat(), client_data['email']))
-            client_id = existing[0]
-        else:
-            # Insert new client
-            c.execute('''INSERT INTO clients 
-                        (name, email, phone, address, company, tax_id, notes,
-                         credit_limit, payment_terms, created_at, updated_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                     (client_data['name'], client_data['email'],
-                      client_data.get('phone'), client_data.get('address'),
-                      client_data.get('company'), client_data.get('tax_id'),
-                      client_data.get('notes'), client_data.get('credit_limit', 0),
-                      client_data.get('payment_terms', 30),
-                      datetime.now().isoformat(), datetime.now().isoformat()))
-            client_id = c.lastrowid
-        
+        client_id, existing = upsert_client_row(c, client_data)
         conn.commit()
+        clear_client_caches()
         log_audit('CREATE' if not existing else 'UPDATE', 'clients', client_id, None, client_data)
         return client_id
 
@@ -568,6 +1068,173 @@ def get_clients(search_term=None):
         with get_db_connection() as conn:
             return pd.read_sql_query("SELECT * FROM clients ORDER BY name", conn)
 
+@st.cache_data(ttl=60, show_spinner=False)
+def get_cached_clients(search_term=None):
+    """Get clients with optional search, reusing results until clients change"""
+    return get_clients(search_term)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_cached_templates():
+    """Get invoice templates, which the app only reads, cached between reruns"""
+    try:
+        with get_db_connection() as conn:
+            return pd.read_sql_query("SELECT * FROM invoice_templates", conn)
+    except:
+        return pd.DataFrame()
+
+def clear_client_caches():
+    """Invalidate cached client queries after a write"""
+    get_cached_clients.clear()
+    get_cached_recurring_invoices.clear()
+    get_cached_recurring_counts.clear()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_cached_payments(limit=None, offset=0):
+    """Get the payment card columns with their invoice details, newest first, cached between reruns"""
+    query = """
+        SELECT p.id, p.invoice_id, p.amount, p.payment_method, p.payment_date,
+               p.reference, p.notes, i.invoice_number, i.client_name, i.currency
+        FROM payments p
+        JOIN invoices i ON p.invoice_id = i.id
+        ORDER BY p.payment_date DESC
+    """
+    params = []
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params = [limit, offset]
+    
+    try:
+        with get_db_connection() as conn:
+            # Parse dates once here so every cached rerun gets datetime values
+            return pd.read_sql_query(query, conn, params=params, parse_dates=['payment_date'])
+    except (sqlite3.Error, pd.errors.DatabaseError):
+        # Keep the columns and date dtype so the page can still format an empty list
+        return pd.DataFrame({
+            column: pd.Series(dtype='datetime64[ns]' if column == 'payment_date' else 'object')
+            for column in ['id', 'invoice_id', 'amount', 'payment_method', 'payment_date',
+                           'reference', 'notes', 'invoice_number', 'client_name', 'currency']
+        })
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_cached_payment_stats():
+    """Get payment count, total, per-method and per-day sums aggregated in SQL"""
+    try:
+        with get_db_connection() as conn:
+            c = conn.cursor()
+            c.execute("""SELECT COUNT(*), COALESCE(SUM(p.amount), 0)
+                         FROM payments p JOIN invoices i ON p.invoice_id = i.id""")
+            payment_count, total_payments = c.fetchone()
+            
+            method_stats = pd.read_sql_query("""
+                SELECT p.payment_method, SUM(p.amount) as sum, COUNT(*) as count
+                FROM payments p
+                JOIN invoices i ON p.invoice_id = i.id
+                GROUP BY p.payment_method
+            """, conn)
+            daily_payments = pd.read_sql_query("""
+                SELECT date(p.payment_date) as payment_date, SUM(p.amount) as amount
+                FROM payments p
+                JOIN invoices i ON p.invoice_id = i.id
+                GROUP BY date(p.payment_date)
+                ORDER BY payment_date
+            """, conn)
+    except:
+        return 0, 0, pd.DataFrame(), pd.DataFrame()
+    
+    return payment_count, total_payments, method_stats, daily_payments
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_cached_recurring_invoices(limit=None, offset=0):
+    """Get recurring schedules with client and template names, cached between reruns"""
+    query = """
+        SELECT r.*, c.name as client_name, t.name as template_name
+        FROM recurring_invoices r
+        LEFT JOIN clients c ON r.client_id = c.id
+        LEFT JOIN invoice_templates t ON r.template_id = t.id
+        ORDER BY r.next_date, r.id
+    """
+    params = []
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params = [limit, offset]
+    
+    try:
+        with get_db_connection() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+    except:
+        return pd.DataFrame()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_cached_recurring_counts():
+    """Get the total and active number of recurring schedules"""
+    try:
+        with get_db_connection() as conn:
+            c = conn.cursor()
+            c.execute("SELECT COUNT(*), COALESCE(SUM(is_active = 1), 0) FROM recurring_invoices")
+            return tuple(c.fetchone())
+    except:
+        return 0, 0
+
+def get_database_key():
+    """Get the database and write-ahead log modification times and sizes, which change on every write"""
+    key = ()
+    for path in ('invoices.db', 'invoices.db-wal'):
+        try:
+            file_stat = os.stat(path)
+            key += (file_stat.st_mtime_ns, file_stat.st_size)
+        except FileNotFoundError:
+            key += (None, None)
+    return key
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def get_database_counts(db_key):
+    """Get invoice, client and payment counts, cached until the database file changes"""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute("""SELECT (SELECT COUNT(*) FROM invoices),
+                            (SELECT COUNT(*) FROM clients),
+                            (SELECT COUNT(*) FROM payments)""")
+        return tuple(c.fetchone())
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def get_users(db_key, limit=500):
+    """Get the user list, cached until the database file changes"""
+    # Only displayed, so Arrow-backed columns can go to st.dataframe as they are
+    with get_db_connection() as conn:
+        return pd.read_sql_query(
+            "SELECT id, username, email, role, full_name, is_active, last_login FROM users ORDER BY id LIMIT ?",
+            conn, params=[limit], dtype_backend="pyarrow"
+        )
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def get_audit_log(db_key, limit=100):
+    """Get the latest audit entries, cached until the database file changes"""
+    # Display only as well, so skip the object-dtype round trip like get_users
+    with get_db_connection() as conn:
+        return pd.read_sql_query(
+            """SELECT timestamp, user_id, action, table_name, record_id
+               FROM audit_log ORDER BY timestamp DESC LIMIT ?""",
+            conn, params=[limit], dtype_backend="pyarrow"
+        )
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_cached_report(query, params):
+    """Run a report query, cached on its SQL and parameters"""
+    with get_db_connection() as conn:
+        return pd.read_sql_query(query, conn, params=params)
+
+@st.cache_resource(ttl=60, show_spinner=False)
+def get_cached_report_table(query, params):
+    """Get a report as an Arrow table that st.dataframe can send without converting it"""
+    import pyarrow as pa
+    # Arrow tables are immutable, so every session can share the same one
+    # instead of unpickling a copy, and the rows never pass through pandas
+    with get_db_connection() as conn:
+        c = conn.execute(query, params)
+        columns = [column[0] for column in c.description]
+        rows = c.fetchall()
+    return pa.table({name: [row[i] for row in rows] for i, name in enumerate(columns)})
+
 @safe_db_operation
 def process_payment(invoice_id, amount, method, reference=None, notes=None):
     """Process payment for invoice"""
@@ -599,6 +1266,7 @@ def process_payment(invoice_id, amount, method, reference=None, notes=None):
                       datetime.now().isoformat(), invoice_id))
             
             conn.commit()
+            clear_invoice_caches()
             log_audit('CREATE', 'payments', c.lastrowid, None, 
                      {'invoice_id': invoice_id, 'amount': amount, 'method': method})
             
@@ -620,33 +1288,60 @@ def create_recurring_invoice(template_id, client_id, frequency, start_date, end_
                   datetime.now().isoformat()))
         
         conn.commit()
+        get_cached_recurring_invoices.clear()
+        get_cached_recurring_counts.clear()
         return c.lastrowid
 
 @safe_db_operation
 def backup_database():
     """Create database backup"""
+    import tempfile
+    
     try:
-        backup_data = io.BytesIO()
-        with open('invoices.db', 'rb') as f:
-            backup_data.write(f.read())
-        
-        backup_data.seek(0)
-        filename = f"invoice_pro_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-        return backup_data.getvalue(), filename
+        # Recent commits may still be in the write-ahead log, so copy through SQLite's
+        # online backup API on a separate connection instead of reading the file
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".db") as temp_file:
+            temp_path = temp_file.name
+        try:
+            source = sqlite3.connect('invoices.db')
+            target = sqlite3.connect(temp_path)
+            try:
+                source.backup(target, pages=64, sleep=0)
+            finally:
+                target.close()
+                source.close()
+            with open(temp_path, 'rb') as f:
+                backup_data = f.read()
+        finally:
+            os.unlink(temp_path)
+        
+        return backup_data
     except Exception as e:
         st.error(f"Backup failed: {e}")
-        return None, None
+        return None
 
 @safe_db_operation
 def restore_database(backup_path):
     """Restore database from backup"""
     try:
-        # Close any existing connections
-        sqlite3.connect('invoices.db').close()
-        
-        # Restore backup
-        import shutil
-        shutil.copy2(backup_path, 'invoices.db')
+        # Copy pages with SQLite's online backup API, so other sessions never
+        # see a half-written file
+        source = sqlite3.connect(backup_path)
+        try:
+            with get_db_connection() as conn:
+                # SQLite cannot change the page size of a WAL database, and leaving WAL
+                # needs every other connection closed, so refuse mismatched backups
+                backup_page_size = source.execute("PRAGMA page_size").fetchone()[0]
+                page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+                if backup_page_size != page_size:
+                    st.error(f"Restore failed: the backup uses {backup_page_size}-byte pages but this database uses {page_size}-byte pages. Restore a backup downloaded from this app.")
+                    return False
+                source.backup(conn)
+        finally:
+            source.close()
+        clear_invoice_caches()
+        clear_client_caches()
+        get_cached_templates.clear()
         
         log_audit('RESTORE', 'database', None, None, {'backup': backup_path})
         return True
@@ -675,9 +1370,8 @@ def generate_pdf_invoice(invoice_data):
         elements = []
         
         # Company Logo and Info
-        if invoice_data['company_info'].get('logo_base64'):
-            logo_data = base64.b64decode(invoice_data['company_info']['logo_base64'])
-            logo_buffer = io.BytesIO(logo_data)
+        if invoice_data['company_info'].get('company_logo'):
+            logo_buffer = io.BytesIO(invoice_data['company_info']['company_logo'])
             img = Image(logo_buffer, width=2*inch, height=1*inch)
             elements.append(img)
         
@@ -813,10 +1507,214 @@ def generate_pdf_invoice(invoice_data):
         st.error(f"PDF generation error: {e}")
         return None
 
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_pdf(payload_json, _logo):
+    """Generate PDF bytes, memoized on the serialized invoice payload"""
+    pdf_data = json.loads(payload_json)
+    pdf_data['company_info']['company_logo'] = _logo
+    return generate_pdf_invoice(pdf_data)
+
+def get_pdf_bytes(pdf_data):
+    """Get PDF bytes for an invoice payload, reusing cached output when unchanged"""
+    # Bytes do not survive JSON, so the logo is passed alongside and keyed by its digest
+    company_info = pdf_data['company_info']
+    logo = company_info.get('company_logo')
+    payload = {**pdf_data, 'company_info': {**company_info, 'company_logo': company_info.get('logo_digest')}}
+    pdf = _cached_pdf(json.dumps(payload, default=str, sort_keys=True), logo)
+    # Always hand out immutable bytes so session_state never holds a file cursor
+    return pdf.getvalue() if hasattr(pdf, 'getvalue') else pdf
+
+@st.cache_data(ttl=600, show_spinner=False, max_entries=128)
+def _cached_invoice_pdf(invoice_id, updated_at, company_info):
+    """Generate PDF bytes for a saved invoice, memoized until it is next updated"""
+    invoice_data, items = get_cached_invoice_by_id(invoice_id)
+    if not invoice_data:
+        return None
+    pdf_data = build_pdf_payload(
+        invoice_data['status'], InvoiceSnapshot.from_record(invoice_data), items,
+        amount_paid=invoice_data['amount_paid'],
+        balance_due=invoice_data['balance_due'],
+        company_info=company_info
+    )
+    pdf = generate_pdf_invoice(pdf_data)
+    return pdf.getvalue() if hasattr(pdf, 'getvalue') else pdf
+
+def get_invoice_pdf_bytes(invoice, company_info):
+    """Get PDF bytes for a saved invoice, keyed on its id and last update"""
+    return _cached_invoice_pdf(int(invoice['id']), invoice.get('updated_at'), company_info)
+
+@st.cache_resource
+def get_pdf_executor():
+    """Get the shared worker pool used for background PDF generation"""
+    return ThreadPoolExecutor(max_workers=2)
+
+@st.cache_resource
+def get_io_executor():
+    """Get the shared worker pool used for slow SMTP and password hashing work"""
+    return ThreadPoolExecutor(max_workers=4)
+
+def submit_task(task_key, func, *args):
+    """Start a task returning (success, message) in the background I/O pool"""
+    st.session_state[task_key] = get_io_executor().submit(func, *args)
+
+@polling_fragment
+def render_background_task(task_key, pending_message):
+    """Show a background task as pending, then report its result and rerun the page"""
+    future = st.session_state.get(task_key)
+    if future is None:
+        return
+    if not future.done():
+        if _native_fragment:
+            st.info(pending_message)
+            return
+        # Without fragments nothing would poll again, so wait for the result here
+        future.result()
+    
+    st.session_state[task_key] = None
+    success, message = future.result()
+    st.session_state.notification = message
+    st.session_state.notification_type = "success" if success else "error"
+    st.rerun()
+
+def build_email_pdf(pdf_data):
+    """Generate the email PDF (runs in the PDF pool), returning (pdf, error message)"""
+    # st.error is not shown from a worker thread, so failures are returned instead
+    try:
+        pdf = get_pdf_bytes(pdf_data)
+    except Exception as e:
+        return None, f"PDF generation error: {e}"
+    if pdf is None:
+        return None, "The invoice PDF could not be generated. Check that reportlab is installed."
+    return pdf, None
+
+def get_email_pdf(wait=False):
+    """Get the email PDF, collecting it from the background job once finished"""
+    future = st.session_state.get('email_pdf_future')
+    if future is not None and (wait or future.done()):
+        st.session_state.email_pdf, st.session_state.email_pdf_error = future.result()
+        st.session_state.email_pdf_future = None
+    return st.session_state.get('email_pdf')
+
+@polling_fragment
+def render_email_pdf_pending():
+    """Show the email PDF as pending, rerunning the page once it has finished"""
+    future = st.session_state.get('email_pdf_future')
+    if future is not None and not future.done():
+        st.info("⏳ Generating PDF in the background...")
+        return
+    st.rerun()
+
+def submit_file_job(job_key, build, *args):
+    """Start building a download file in the background worker pool"""
+    st.session_state.file_jobs[job_key] = get_pdf_executor().submit(build, *args)
+
+def render_file_job(job_key, label, file_name, mime, key):
+    """Show the download button for a background file job once it has finished"""
+    future = st.session_state.file_jobs.get(job_key)
+    if future is None:
+        return
+    if not future.done():
+        if _native_fragment:
+            render_file_job_pending(job_key)
+            return
+        # Without fragments nothing would rerun the page, so wait for the file here
+        future.result()
+    # The button now holds the file for this run, so the session stops keeping the job;
+    # failed jobs are dropped too, so the next click starts a fresh one
+    data = st.session_state.file_jobs.pop(job_key).result()
+    if data:
+        st.download_button(
+            label=label,
+            data=data,
+            file_name=file_name,
+            mime=mime,
+            key=key
+        )
+
+@polling_fragment
+def render_file_job_pending(job_key):
+    """Show a file job as pending, rerunning the page once it has finished"""
+    future = st.session_state.file_jobs.get(job_key)
+    if future is not None and not future.done():
+        st.caption("⏳ Preparing...")
+        return
+    st.rerun()
+
 # ============================================================================
 # EMAIL FUNCTIONS
 # ============================================================================
 
+def save_env_settings(settings):
+    """Write settings to .env and the process environment"""
+    import tempfile
+    # Write a sibling temp file and rename it over .env, so a crash or a
+    # concurrent save never leaves a truncated or interleaved file behind
+    fd, temp_path = tempfile.mkstemp(dir='.', prefix='.env.', text=True)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            for name, value in settings.items():
+                f.write(f"{name}={value}\n")
+        os.replace(temp_path, '.env')
+    except:
+        os.unlink(temp_path)
+        raise
+    
+    os.environ.update(settings)
+
+def close_smtp_connection(current):
+    """Quit a cached SMTP connection, ignoring one the server already dropped"""
+    server = current.pop('server', None)
+    current.pop('key', None)
+    if server is not None:
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+
+def new_smtp_connection_cache():
+    """Get an empty SMTP connection cache for a session"""
+    cache = {'lock': threading.Lock(), 'current': {}}
+    # Quit the open connection once the session drops its cache; the finalizer
+    # hangs off the lock so that it does not keep the cache alive itself
+    weakref.finalize(cache['lock'], close_smtp_connection, cache['current'])
+    return cache
+
+@contextmanager
+def get_smtp_connection(connection_cache, smtp_server, smtp_port, smtp_username, smtp_password, use_tls):
+    """Get an authenticated SMTP connection, reusing the session's open one while it is alive"""
+    # connection_cache is the session's dict, passed in so worker threads can use it too;
+    # its lock keeps the script thread and a worker from using the connection at once
+    with connection_cache['lock']:
+        current = connection_cache['current']
+        key = (smtp_server, smtp_port, smtp_username, use_tls,
+               hashlib.sha256(smtp_password.encode()).hexdigest())
+        server = current.get('server')
+        
+        # Reuse skips the TLS handshake and login when nothing changed
+        try:
+            if server is None or current.get('key') != key or server.noop()[0] != 250:
+                server = None
+        except (smtplib.SMTPException, OSError):
+            server = None
+        
+        if server is None:
+            close_smtp_connection(current)
+            server = smtplib.SMTP(smtp_server, smtp_port)
+            if use_tls:
+                server.starttls()
+            server.login(smtp_username, smtp_password)
+            current.update(key=key, server=server)
+        yield server
+
+def send_test_email(connection_cache, smtp_settings, msg):
+    """Send the settings test email (runs in the background I/O pool)"""
+    try:
+        with get_smtp_connection(connection_cache, *smtp_settings) as server:
+            server.send_message(msg)
+        return True, f"✓ Test email sent to {msg['To']}"
+    except Exception as e:
+        return False, f"Error sending test email: {e}"
+
 def send_email_invoice(to_email, pdf_buffer, invoice_number):
     """Send invoice via email"""
     try:
@@ -868,12 +1766,9 @@ def send_email_invoice(to_email, pdf_buffer, invoice_number):
             msg.attach(attachment)
         
         # Send email
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        if use_tls:
-            server.starttls()
-        server.login(smtp_username, smtp_password)
-        server.send_message(msg)
-        server.quit()
+        with get_smtp_connection(st.session_state.smtp_connection, smtp_server, smtp_port,
+                                 smtp_username, smtp_password, use_tls) as server:
+            server.send_message(msg)
         
         log_audit('EMAIL', 'invoices', None, None, {'to': to_email, 'invoice': invoice_number})
         
@@ -985,9 +1880,7 @@ def export_to_excel(invoice_data, items):
 # STYLING
 # ============================================================================
 
-def add_custom_css():
-    """Add custom CSS styling"""
-    st.markdown("""
+CUSTOM_CSS = """
     <style>
     /* Main container */
     .main {
@@ -1031,6 +1924,42 @@ def add_custom_css():
         border: 1px solid #e0e0e0;
     }
     
+    /* Totals table */
+    .totals-table {
+        margin-left: auto;
+        border-collapse: collapse;
+        font-weight: bold;
+    }
+    
+    .totals-table td {
+        padding: 4px 12px;
+        border: none;
+        text-align: right;
+    }
+    
+    .totals-table tr.grand-total td {
+        border-top: 2px solid #2c3e50;
+        font-size: 1.1em;
+    }
+    
+    /* Invoice list rows */
+    .invoice-row {
+        display: grid;
+        grid-template-columns: 2fr 2fr 1.5fr 1.5fr;
+        gap: 10px;
+        align-items: start;
+    }
+    
+    .invoice-row > div {
+        display: flex;
+        flex-direction: column;
+        gap: 4px;
+    }
+    
+    .invoice-row small {
+        color: #7f8c8d;
+    }
+    
     /* Status badges */
     .status-badge {
         display: inline-block;
@@ -1230,7 +2159,27 @@ def add_custom_css():
         opacity: 1;
     }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+CARD_OPEN_HTML = '<div class="business-card">'
+# A card holding just a tab heading, sent as one markdown element
+CARD_HEADER_HTML = '<div class="business-card"><h5>{}</h5></div>'
+ACTIONS_OPEN_HTML = '<div class="action-buttons">'
+PREVIEW_OPEN_HTML = '<div class="invoice-preview">'
+DIV_CLOSE_HTML = '</div>'
+
+PREVIEW_ITEMS_COLUMN_CONFIG = {
+    "Description": st.column_config.TextColumn("Description", width=200),
+    "Qty": st.column_config.TextColumn("Qty", width=60),
+    "Unit Price": st.column_config.TextColumn("Unit Price", width=100),
+    "Tax %": st.column_config.TextColumn("Tax %", width=60),
+    "Disc %": st.column_config.TextColumn("Disc %", width=60),
+    "Total": st.column_config.TextColumn("Total", width=100)
+}
+
+def add_custom_css():
+    """Add custom CSS styling"""
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 # ============================================================================
 # PAGE FUNCTIONS
@@ -1238,6 +2187,7 @@ def add_custom_css():
 
 def render_dashboard_page():
     """Render the dashboard page"""
+    import plotly.express as px
     
     st.markdown('<div class="section-header">📊 Dashboard</div>', unsafe_allow_html=True)
     
@@ -1345,7 +2295,7 @@ def render_dashboard_page():
                 <div class="business-card">
                     <strong>{inv['invoice_number']}</strong> - {inv['client_name']}<br>
                     Amount: {format_amount(inv['grand_total'], st.session_state.currency)}<br>
-                    Status: {get_status_badge_html(inv['status'])}<br>
+                    Status: {STATUS_BADGE_HTML.get(inv['status']) or get_status_badge_html(inv['status'])}<br>
                     Due: {inv['due_date']}
                 </div>
                 """, unsafe_allow_html=True)
@@ -1368,20 +2318,201 @@ def render_dashboard_page():
         else:
             st.info("No upcoming due dates")
 
+@dataclass(frozen=True)
+class InvoiceSnapshot:
+    """Immutable invoice fields shared by the save, PDF and export actions"""
+    invoice_number: str
+    client_name: str
+    client_email: str
+    client_address: str
+    client_phone: str
+    invoice_date: str
+    due_date: str
+    po_number: str
+    currency: str
+    subtotal: float
+    discount_total: float
+    tax_total: float
+    grand_total: float
+    notes: str = None
+    recurring_frequency: str = None
+    recurring_next_date: str = None
+    
+    @property
+    def client(self):
+        """Client details in the shape used by save_client_to_db and the PDF"""
+        return {
+            'name': self.client_name,
+            'address': self.client_address,
+            'email': self.client_email,
+            'phone': self.client_phone
+        }
+    
+    @classmethod
+    def from_record(cls, invoice):
+        """Build a snapshot from a saved invoice row"""
+        return cls(**{field.name: invoice.get(field.name) for field in fields(cls)})
+
+def build_invoice_record(status, snapshot, **extra):
+    """Build the invoice record stored in the database"""
+    record = asdict(snapshot)
+    record.update({
+        'amount_paid': 0,
+        'balance_due': snapshot.grand_total,
+        'status': status
+    })
+    record.update(extra)
+    return record
+
+def build_pdf_payload(status, snapshot, items, amount_paid=0, balance_due=None, company_info=None):
+    """Build the payload consumed by generate_pdf_invoice"""
+    return {
+        'invoice_number': snapshot.invoice_number,
+        'invoice_date': snapshot.invoice_date,
+        'due_date': snapshot.due_date,
+        'po_number': snapshot.po_number,
+        'currency': snapshot.currency,
+        'status': status,
+        'client': snapshot.client,
+        'company_info': st.session_state.company_info if company_info is None else company_info,
+        'items': items,
+        'totals': {
+            'subtotal': snapshot.subtotal,
+            'discount': snapshot.discount_total,
+            'tax': snapshot.tax_total,
+            'grand_total': snapshot.grand_total
+        },
+        'notes': snapshot.notes,
+        'amount_paid': amount_paid,
+        'balance_due': snapshot.grand_total if balance_due is None else balance_due
+    }
+
+def reset_invoice_draft():
+    """Clear the invoice being edited and start a new invoice number"""
+    st.session_state.invoice_items = []
+    st.session_state.items_version += 1
+    st.session_state.invoice_number = generate_invoice_number()
+    st.session_state.invoice_notes = ''
+    st.session_state.edit_index = -1
+
+def save_draft_invoice(snapshot, items, client_data):
+    """Save the invoice as a draft and reset the form"""
+    invoice_id, errors, warnings = save_invoice_and_client(
+        build_invoice_record('Draft', snapshot), items, client_data
+    )
+    
+    if invoice_id:
+        st.session_state.notification = f"✓ Invoice {snapshot.invoice_number} saved as Draft"
+        st.session_state.notification_type = "success"
+        reset_invoice_draft()
+    else:
+        st.session_state.notification = "; ".join(errors + warnings) or "Invoice could not be saved"
+        st.session_state.notification_type = "error"
+
+@fragment
+def render_invoice_actions(invoice_date_str, due_date_str, po_number, client_name, client_email,
+                           client_address, client_phone, auto_save_client, invoice_status,
+                           recurring_frequency, recurring_end_str, invoice_notes,
+                           subtotal, total_discount, total_tax, grand_total):
+    """Render the create invoice action buttons"""
+    
+    snapshot = InvoiceSnapshot(
+        invoice_number=st.session_state.invoice_number,
+        client_name=client_name,
+        client_email=client_email,
+        client_address=client_address,
+        client_phone=client_phone,
+        invoice_date=invoice_date_str,
+        due_date=due_date_str,
+        po_number=po_number,
+        currency=st.session_state.currency,
+        subtotal=subtotal,
+        discount_total=total_discount,
+        tax_total=total_tax,
+        grand_total=grand_total,
+        notes=invoice_notes,
+        recurring_frequency=recurring_frequency if recurring_frequency != 'None' else None,
+        recurring_next_date=recurring_end_str if recurring_frequency != 'None' else None
+    )
+    
+    # One copy of the items serves every action; the builders only read it
+    items = list(st.session_state.invoice_items)
+    company_info = st.session_state.company_info
+    
+    st.markdown(ACTIONS_OPEN_HTML, unsafe_allow_html=True)
+    
+    col1, col2, col3, col4, col5 = st.columns(5)
+    
+    with col1:
+        # Saved in the click's own run, not an on_click callback, whose arguments would be
+        # the snapshot from the previous run and miss the edit that came with the click
+        if st.button("💾 Save as Draft", use_container_width=True):
+            save_draft_invoice(snapshot, items, snapshot.client if auto_save_client and client_email else None)
+            # Refresh the whole page, not just this fragment
+            st.rerun()
+    
+    with col2:
+        if st.button("📤 Save & Send", use_container_width=True):
+            invoice_data = build_invoice_record('Sent', snapshot, sent_date=datetime.now().isoformat())
+            
+            client_data = snapshot.client if auto_save_client and client_email else None
+            invoice_id, errors, warnings = save_invoice_and_client(invoice_data, items, client_data)
+            
+            if invoice_id:
+                # Generate PDF for email in the background
+                pdf_data = build_pdf_payload('Sent', snapshot, items, company_info=company_info)
+                pdf_future = get_pdf_executor().submit(build_email_pdf, pdf_data)
+                
+                st.session_state.notification = f"✓ Invoice {st.session_state.invoice_number} saved and ready to send"
+                st.session_state.notification_type = "success"
+                
+                # Open email dialog
+                st.session_state.show_email_modal = True
+                st.session_state.email_invoice_id = invoice_id
+                st.session_state.email_pdf = None
+                st.session_state.email_pdf_error = None
+                st.session_state.email_pdf_future = pdf_future
+                st.rerun()
+    
+    # The export payloads are only built when a download is requested
+    with col3:
+        lazy_download_button(
+            "👁️ Preview PDF",
+            "📥 Download PDF",
+            lambda: get_pdf_bytes(build_pdf_payload(invoice_status, snapshot, items, company_info=company_info)),
+            file_name=f"invoice_{snapshot.invoice_number}.pdf",
+            mime="application/pdf",
+            key="create_pdf_download"
+        )
+    
+    with col4:
+        lazy_download_button(
+            "📊 Export Excel",
+            "📥 Download Excel",
+            lambda: export_to_excel(build_invoice_record(invoice_status, snapshot), items),
+            file_name=f"invoice_{snapshot.invoice_number}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            key="create_excel_download"
+        )
+    
+    with col5:
+        if st.button("🔄 Clear Form", use_container_width=True):
+            reset_invoice_draft()
+            st.rerun()
+    
+    st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
+
 def render_create_invoice_page():
     """Render the create invoice page"""
     
     st.markdown('<div class="section-header">➕ Create New Invoice</div>', unsafe_allow_html=True)
     
-    # Initialize session state for invoice items if not exists
-    if 'invoice_items' not in st.session_state:
-        st.session_state.invoice_items = []
-    if 'edit_index' not in st.session_state:
-        st.session_state.edit_index = -1
+    # Initialize session state for the invoice draft if not exists
+    for key, default in {'invoice_items': [], 'items_version': 0, 'next_item_uid': 0, 'edit_index': -1,
+                         'invoice_notes': '', 'show_email_modal': False}.items():
+        st.session_state.setdefault(key, default)
     if 'invoice_number' not in st.session_state:
         st.session_state.invoice_number = generate_invoice_number()
-    if 'invoice_notes' not in st.session_state:
-        st.session_state.invoice_notes = ''
     
     # Invoice Header
     col1, col2, col3 = st.columns([2, 2, 1])
@@ -1392,6 +2523,8 @@ def render_create_invoice_page():
     with col2:
         invoice_date = st.date_input("Invoice Date", datetime.now())
         due_date = st.date_input("Due Date", datetime.now() + timedelta(days=30))
+        invoice_date_str = invoice_date.isoformat()
+        due_date_str = due_date.isoformat()
     
     with col3:
         po_number = st.text_input("PO Number", placeholder="Optional")
@@ -1401,6 +2534,8 @@ def render_create_invoice_page():
     # Client Information
     st.markdown("##### Client Information")
     
+    # Not a form: the save buttons must always see what was typed, and they
+    # cannot live in the same form as these fields
     col1, col2 = st.columns(2)
     
     with col1:
@@ -1419,7 +2554,7 @@ def render_create_invoice_page():
     
     # Item input form
     with st.container():
-        st.markdown('<div class="business-card">', unsafe_allow_html=True)
+        st.markdown(CARD_OPEN_HTML, unsafe_allow_html=True)
         
         col1, col2, col3, col4, col5, col6 = st.columns([3, 1, 1, 1, 1, 1])
         
@@ -1450,397 +2585,296 @@ def render_create_invoice_page():
                         'total': total
                     }
                     
+                    # Rows key their widgets on the item's uid, which an edit keeps
                     if st.session_state.edit_index >= 0:
+                        item['uid'] = st.session_state.invoice_items[st.session_state.edit_index]['uid']
                         st.session_state.invoice_items[st.session_state.edit_index] = item
                         st.session_state.edit_index = -1
                     else:
+                        item['uid'] = st.session_state.next_item_uid
+                        st.session_state.next_item_uid += 1
                         st.session_state.invoice_items.append(item)
+                    st.session_state.items_version += 1
                     
                     st.rerun()
         
-        st.markdown('</div>', unsafe_allow_html=True)
+        st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
     
     # Display items
-    if st.session_state.invoice_items:
-        st.markdown("##### Current Items")
-        
-        items_df = pd.DataFrame(st.session_state.invoice_items)
-        items_df['Total'] = items_df['total'].apply(lambda x: format_amount(x, st.session_state.currency))
-        
-        # Display items table
-        for i, item in enumerate(st.session_state.invoice_items):
-            with st.container():
-                st.markdown('<div class="business-card">', unsafe_allow_html=True)
-                
-                col1, col2, col3, col4, col5, col6, col7 = st.columns([3, 1, 1, 1, 1, 1.5, 1])
-                
-                with col1:
-                    st.markdown(f"**{item['description']}**")
-                with col2:
-                    st.markdown(f"Qty: {item['quantity']:.2f}")
-                with col3:
-                    st.markdown(f"@ {format_amount(item['unit_price'], st.session_state.currency)}")
-                with col4:
-                    st.markdown(f"Tax: {item['tax_rate']}%")
-                with col5:
-                    st.markdown(f"Disc: {item['discount']}%")
-                with col6:
-                    st.markdown(f"**{format_amount(item['total'], st.session_state.currency)}**")
-                with col7:
-                    if st.button("✏️", key=f"edit_{i}", help="Edit item"):
-                        st.session_state.edit_index = i
-                        st.rerun()
-                    if st.button("🗑️", key=f"del_{i}", help="Delete item"):
-                        st.session_state.invoice_items.pop(i)
-                        if st.session_state.edit_index == i:
-                            st.session_state.edit_index = -1
-                        st.rerun()
-                
-                st.markdown('</div>', unsafe_allow_html=True)
-        
-        # Calculate totals
-        subtotal = sum(item['quantity'] * item['unit_price'] for item in st.session_state.invoice_items)
-        total_discount = sum((item['quantity'] * item['unit_price']) * (item['discount'] / 100) for item in st.session_state.invoice_items)
-        taxable_amount = subtotal - total_discount
-        total_tax = sum(taxable_amount * (item['tax_rate'] / 100) for item in st.session_state.invoice_items)
-        grand_total = subtotal - total_discount + total_tax
-        
-        st.divider()
-        
-        # Advanced Options
-        with st.expander("⚙️ Advanced Options"):
-            col1, col2 = st.columns(2)
-            with col1:
-                currency = st.selectbox(
-                    "Currency",
-                    options=list(CURRENCIES.keys()),
-                    format_func=lambda x: f"{CURRENCIES[x]['symbol']} {CURRENCIES[x]['name']}",
-                    index=list(CURRENCIES.keys()).index(st.session_state.currency)
-                )
-                st.session_state.currency = currency
-            
-            with col2:
-                invoice_status = st.selectbox(
-                    "Invoice Status",
-                    options=INVOICE_STATUSES,
-                    index=0
-                )
-            
-            recurring_frequency = st.selectbox(
-                "Recurring Frequency",
-                options=list(RECURRING_FREQUENCIES.keys())
-            )
-            
-            if recurring_frequency != 'None':
-                recurring_end = st.date_input("Recurring End Date (Optional)", value=None, min_value=invoice_date)
-            else:
-                recurring_end = None
+    if not st.session_state.invoice_items:
+        st.info("💡 Add items and client information to create your invoice")
+        return
+    
+    st.markdown("##### Current Items")
+    
+    # Display items table, reading the currency once rather than per item
+    currency = st.session_state.currency
+    for i, item in enumerate(st.session_state.invoice_items):
+        with st.container():
+            st.markdown(CARD_OPEN_HTML, unsafe_allow_html=True)
             
-            invoice_notes = st.text_area("Notes", value=st.session_state.invoice_notes, height=100)
-            st.session_state.invoice_notes = invoice_notes
-        
-        st.divider()
-        
-        # Invoice Preview
-        with st.expander("👁️ Invoice Preview", expanded=True):
-            st.markdown('<div class="invoice-preview">', unsafe_allow_html=True)
+            col1, col2, col3, col4, col5, col6, col7 = st.columns([3, 1, 1, 1, 1, 1.5, 1])
             
-            # Company Info
-            col1, col2 = st.columns(2)
             with col1:
-                if st.session_state.company_info.get('logo_base64'):
-                    st.markdown(get_logo_html("60px", "150px"), unsafe_allow_html=True)
-                st.markdown(f"**{st.session_state.company_info['name']}**")
-                st.markdown(st.session_state.company_info['address'])
-                st.markdown(st.session_state.company_info.get('city', ''))
-                st.markdown(f"Phone: {st.session_state.company_info['phone']}")
-                st.markdown(f"Email: {st.session_state.company_info['email']}")
-                st.markdown(f"TRN: {st.session_state.company_info['tax_id']}")
-            
+                st.markdown(f"**{item['description']}**")
             with col2:
-                st.markdown(f"**INVOICE**")
-                st.markdown(f"**Invoice #:** {st.session_state.invoice_number}")
-                st.markdown(f"**Date:** {invoice_date.strftime('%Y-%m-%d')}")
-                st.markdown(f"**Due Date:** {due_date.strftime('%Y-%m-%d')}")
-                if po_number:
-                    st.markdown(f"**PO #:** {po_number}")
-            
-            st.divider()
-            
-            # Client Info
-            st.markdown("**Bill To:**")
-            st.markdown(client_name)
-            if client_address:
-                st.markdown(client_address)
-            if client_email:
-                st.markdown(f"Email: {client_email}")
-            if client_phone:
-                st.markdown(f"Phone: {client_phone}")
-            
-            st.divider()
-            
-            # Items Table
-            preview_items = []
-            for item in st.session_state.invoice_items:
-                preview_items.append({
-                    'Description': item['description'],
-                    'Qty': f"{item['quantity']:.2f}",
-                    'Unit Price': format_amount(item['unit_price'], st.session_state.currency),
-                    'Tax %': f"{item['tax_rate']:.1f}%",
-                    'Disc %': f"{item['discount']:.1f}%",
-                    'Total': format_amount(item['total'], st.session_state.currency)
-                })
-            
-            st.dataframe(
-                pd.DataFrame(preview_items),
-                use_container_width=True,
-                hide_index=True,
-                column_config={
-                    "Description": st.column_config.TextColumn("Description", width=200),
-                    "Qty": st.column_config.TextColumn("Qty", width=60),
-                    "Unit Price": st.column_config.TextColumn("Unit Price", width=100),
-                    "Tax %": st.column_config.TextColumn("Tax %", width=60),
-                    "Disc %": st.column_config.TextColumn("Disc %", width=60),
-                    "Total": st.column_config.TextColumn("Total", width=100)
-                }
-            )
-            
-            # Totals
-            col1, col2, col3 = st.columns([3, 1, 2])
-            with col2:
-                st.markdown("**Subtotal:**")
-                st.markdown("**Discount:**")
-                st.markdown("**Tax:**")
-                st.markdown("---")
-                st.markdown("**GRAND TOTAL:**")
+                st.markdown(f"Qty: {item['quantity']:.2f}")
             with col3:
-                st.markdown(f"**{format_amount(subtotal, st.session_state.currency)}**")
-                st.markdown(f"**-{format_amount(total_discount, st.session_state.currency)}**")
-                st.markdown(f"**{format_amount(total_tax, st.session_state.currency)}**")
-                st.markdown("---")
-                st.markdown(f"**{format_amount(grand_total, st.session_state.currency)}**")
-            
-            # Notes
-            if invoice_notes:
-                st.divider()
-                st.markdown("**Notes:**")
-                st.markdown(invoice_notes)
+                st.markdown(f"@ {format_amount(item['unit_price'], currency)}")
+            with col4:
+                st.markdown(f"Tax: {item['tax_rate']}%")
+            with col5:
+                st.markdown(f"Disc: {item['discount']}%")
+            with col6:
+                st.markdown(f"**{format_amount(item['total'], currency)}**")
+            with col7:
+                st.button("✏️", key=f"edit_{item['uid']}", help="Edit item",
+                          on_click=set_state, kwargs={'edit_index': i})
+                if st.button("🗑️", key=f"del_{item['uid']}", help="Delete item"):
+                    st.session_state.invoice_items = [
+                        other for other in st.session_state.invoice_items if other['uid'] != item['uid']
+                    ]
+                    st.session_state.items_version += 1
+                    if st.session_state.edit_index == i:
+                        st.session_state.edit_index = -1
+                    elif st.session_state.edit_index > i:
+                        st.session_state.edit_index -= 1
+                    st.rerun()
             
-            st.markdown('</div>', unsafe_allow_html=True)
+            st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
+    
+    # Calculate totals, reusing the previous result until the items change
+    if st.session_state.get('totals_version') != st.session_state.items_version:
+        st.session_state.invoice_totals = compute_invoice_totals(st.session_state.invoice_items)
+        st.session_state.totals_version = st.session_state.items_version
+    subtotal, total_discount, total_tax, grand_total = st.session_state.invoice_totals
+    
+    st.divider()
+    
+    # Advanced Options
+    with st.expander("⚙️ Advanced Options"):
+        col1, col2 = st.columns(2)
+        with col1:
+            currency = st.selectbox(
+                "Currency",
+                options=CURRENCY_CODES,
+                format_func=CURRENCY_LABELS.get,
+                index=CURRENCY_INDEX.get(st.session_state.currency, 0)
+            )
+            st.session_state.currency = currency
         
-        # Action Buttons
-        st.markdown('<div class="action-buttons">', unsafe_allow_html=True)
+        with col2:
+            invoice_status = st.selectbox(
+                "Invoice Status",
+                options=INVOICE_STATUSES,
+                index=0
+            )
         
-        col1, col2, col3, col4, col5 = st.columns(5)
+        recurring_frequency = st.selectbox(
+            "Recurring Frequency",
+            options=list(RECURRING_FREQUENCIES.keys())
+        )
+        
+        if recurring_frequency != 'None':
+            recurring_end = st.date_input("Recurring End Date (Optional)", value=None, min_value=invoice_date)
+        else:
+            recurring_end = None
+        recurring_end_str = recurring_end.isoformat() if recurring_end else None
         
+        invoice_notes = st.text_area("Notes", value=st.session_state.invoice_notes, height=100)
+        st.session_state.invoice_notes = invoice_notes
+    
+    st.divider()
+    
+    # Invoice Preview
+    with st.expander("👁️ Invoice Preview", expanded=True):
+        st.markdown(PREVIEW_OPEN_HTML, unsafe_allow_html=True)
+        
+        # Company Info
+        col1, col2 = st.columns(2)
         with col1:
-            if st.button("💾 Save as Draft", use_container_width=True):
-                invoice_data = {
-                    'invoice_number': st.session_state.invoice_number,
-                    'client_name': client_name,
-                    'client_email': client_email,
-                    'client_address': client_address,
-                    'client_phone': client_phone,
-                    'invoice_date': invoice_date.strftime('%Y-%m-%d'),
-                    'due_date': due_date.strftime('%Y-%m-%d'),
-                    'po_number': po_number,
-                    'currency': st.session_state.currency,
-                    'subtotal': subtotal,
-                    'tax_total': total_tax,
-                    'discount_total': total_discount,
-                    'grand_total': grand_total,
-                    'amount_paid': 0,
-                    'balance_due': grand_total,
-                    'status': 'Draft',
-                    'notes': invoice_notes,
-                    'recurring_frequency': recurring_frequency if recurring_frequency != 'None' else None,
-                    'recurring_next_date': recurring_end.strftime('%Y-%m-%d') if recurring_frequency != 'None' and recurring_end else None
-                }
-                
-                invoice_id, errors, warnings = save_invoice_to_db(invoice_data, st.session_state.invoice_items)
-                
-                if invoice_id:
-                    # Save client if option selected
-                    if auto_save_client and client_email:
-                        client_data = {
-                            'name': client_name,
-                            'email': client_email,
-                            'phone': client_phone,
-                            'address': client_address
-                        }
-                        save_client_to_db(client_data)
-                    
-                    st.session_state.notification = f"✓ Invoice {st.session_state.invoice_number} saved as Draft"
-                    st.session_state.notification_type = "success"
-                    st.session_state.invoice_items = []
-                    st.session_state.invoice_number = generate_invoice_number()
-                    st.session_state.invoice_notes = ''
-                    st.rerun()
-                else:
-                    for error in errors:
-                        st.error(error)
-                    for warning in warnings:
-                        st.warning(warning)
+            if st.session_state.company_info.get('company_logo'):
+                st.markdown(get_logo_html("60px", "150px"), unsafe_allow_html=True)
+            st.markdown(f"**{st.session_state.company_info['name']}**")
+            st.markdown(st.session_state.company_info['address'])
+            st.markdown(st.session_state.company_info.get('city', ''))
+            st.markdown(f"Phone: {st.session_state.company_info['phone']}")
+            st.markdown(f"Email: {st.session_state.company_info['email']}")
+            st.markdown(f"TRN: {st.session_state.company_info['tax_id']}")
         
         with col2:
-            if st.button("📤 Save & Send", use_container_width=True):
-                invoice_data = {
-                    'invoice_number': st.session_state.invoice_number,
-                    'client_name': client_name,
-                    'client_email': client_email,
-                    'client_address': client_address,
-                    'client_phone': client_phone,
-                    'invoice_date': invoice_date.strftime('%Y-%m-%d'),
-                    'due_date': due_date.strftime('%Y-%m-%d'),
-                    'po_number': po_number,
-                    'currency': st.session_state.currency,
-                    'subtotal': subtotal,
-                    'tax_total': total_tax,
-                    'discount_total': total_discount,
-                    'grand_total': grand_total,
-                    'amount_paid': 0,
-                    'balance_due': grand_total,
-                    'status': 'Sent',
-                    'notes': invoice_notes,
-                    'sent_date': datetime.now().isoformat(),
-                    'recurring_frequency': recurring_frequency if recurring_frequency != 'None' else None,
-                    'recurring_next_date': recurring_end.strftime('%Y-%m-%d') if recurring_frequency != 'None' and recurring_end else None
-                }
-                
-                invoice_id, errors, warnings = save_invoice_to_db(invoice_data, st.session_state.invoice_items)
-                
-                if invoice_id:
-                    # Generate PDF for email
-                    pdf_data = {
-                        'invoice_number': st.session_state.invoice_number,
-                        'invoice_date': invoice_date.strftime('%Y-%m-%d'),
-                        'due_date': due_date.strftime('%Y-%m-%d'),
-                        'po_number': po_number,
-                        'currency': st.session_state.currency,
-                        'status': 'Sent',
-                        'client': {
-                            'name': client_name,
-                            'address': client_address,
-                            'email': client_email,
-                            'phone': client_phone
-                        },
-                        'company_info': st.session_state.company_info,
-                        'items': st.session_state.invoice_items,
-                        'totals': {
-                            'subtotal': subtotal,
-                            'discount': total_discount,
-                            'tax': total_tax,
-                            'grand_total': grand_total
-                        },
-                        'notes': invoice_notes,
-                        'amount_paid': 0,
-                        'balance_due': grand_total
-                    }
-                    
-                    pdf_buffer = generate_pdf_invoice(pdf_data)
-                    
-                    # Save client if option selected
-                    if auto_save_client and client_email:
-                        client_data = {
-                            'name': client_name,
-                            'email': client_email,
-                            'phone': client_phone,
-                            'address': client_address
-                        }
-                        save_client_to_db(client_data)
-                    
-                    st.session_state.notification = f"✓ Invoice {st.session_state.invoice_number} saved and ready to send"
-                    st.session_state.notification_type = "success"
-                    
-                    # Open email dialog
-                    st.session_state.show_email_modal = True
-                    st.session_state.email_invoice_id = invoice_id
-                    st.session_state.email_pdf = pdf_buffer
-                    st.rerun()
+            st.markdown(f"**INVOICE**")
+            st.markdown(f"**Invoice #:** {st.session_state.invoice_number}")
+            st.markdown(f"**Date:** {invoice_date_str}")
+            st.markdown(f"**Due Date:** {due_date_str}")
+            if po_number:
+                st.markdown(f"**PO #:** {po_number}")
         
-        with col3:
-            if st.button("👁️ Preview PDF", use_container_width=True):
-                pdf_data = {
-                    'invoice_number': st.session_state.invoice_number,
-                    'invoice_date': invoice_date.strftime('%Y-%m-%d'),
-                    'due_date': due_date.strftime('%Y-%m-%d'),
-                    'po_number': po_number,
-                    'currency': st.session_state.currency,
-                    'status': invoice_status,
-                    'client': {
-                        'name': client_name,
-                        'address': client_address,
-                        'email': client_email,
-                        'phone': client_phone
-                    },
-                    'company_info': st.session_state.company_info,
-                    'items': st.session_state.invoice_items,
-                    'totals': {
-                        'subtotal': subtotal,
-                        'discount': total_discount,
-                        'tax': total_tax,
-                        'grand_total': grand_total
-                    },
-                    'notes': invoice_notes,
-                    'amount_paid': 0,
-                    'balance_due': grand_total
-                }
-                
-                pdf_buffer = generate_pdf_invoice(pdf_data)
-                if pdf_buffer:
-                    st.download_button(
-                        label="📥 Download PDF",
-                        data=pdf_buffer,
-                        file_name=f"invoice_{st.session_state.invoice_number}.pdf",
-                        mime="application/pdf",
-                        use_container_width=True
-                    )
+        st.divider()
         
-        with col4:
-            if st.button("📊 Export Excel", use_container_width=True):
-                invoice_data_export = {
-                    'invoice_number': st.session_state.invoice_number,
-                    'client_name': client_name,
-                    'client_email': client_email,
-                    'client_phone': client_phone,
-                    'client_address': client_address,
-                    'invoice_date': invoice_date.strftime('%Y-%m-%d'),
-                    'due_date': due_date.strftime('%Y-%m-%d'),
-                    'po_number': po_number,
-                    'currency': st.session_state.currency,
-                    'subtotal': subtotal,
-                    'tax_total': total_tax,
-                    'discount_total': total_discount,
-                    'grand_total': grand_total
-                }
-                
-                excel_buffer = export_to_excel(invoice_data_export, st.session_state.invoice_items)
-                if excel_buffer:
-                    st.download_button(
-                        label="📥 Download Excel",
-                        data=excel_buffer,
-                        file_name=f"invoice_{st.session_state.invoice_number}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        use_container_width=True
-                    )
+        # Client Info
+        st.markdown("**Bill To:**")
+        st.markdown(client_name)
+        if client_address:
+            st.markdown(client_address)
+        if client_email:
+            st.markdown(f"Email: {client_email}")
+        if client_phone:
+            st.markdown(f"Phone: {client_phone}")
         
-        with col5:
-            if st.button("🔄 Clear Form", use_container_width=True):
-                st.session_state.invoice_items = []
-                st.session_state.invoice_number = generate_invoice_number()
-                st.session_state.invoice_notes = ''
-                st.session_state.edit_index = -1
-                st.rerun()
+        st.divider()
+        
+        # Items Table, rebuilt only when the items or the currency change
+        preview_key = (st.session_state.items_version, currency)
+        if st.session_state.get('preview_items_key') != preview_key:
+            # Format whole columns at once rather than item by item
+            items_df = pd.DataFrame(
+                st.session_state.invoice_items,
+                columns=['description', 'quantity', 'unit_price', 'tax_rate', 'discount', 'total']
+            )
+            st.session_state.preview_items_df = pd.DataFrame({
+                'Description': items_df['description'],
+                'Qty': items_df['quantity'].map('{:.2f}'.format),
+                'Unit Price': format_amount_vec(items_df['unit_price'], currency),
+                'Tax %': items_df['tax_rate'].map('{:.1f}%'.format),
+                'Disc %': items_df['discount'].map('{:.1f}%'.format),
+                'Total': format_amount_vec(items_df['total'], currency)
+            })
+            st.session_state.preview_items_key = preview_key
+        
+        st.dataframe(
+            st.session_state.preview_items_df,
+            use_container_width=True,
+            hide_index=True,
+            column_config=PREVIEW_ITEMS_COLUMN_CONFIG
+        )
+        
+        # Totals
+        st.markdown(get_totals_table_html([
+            ('Subtotal:', format_amount(subtotal, currency)),
+            ('Discount:', f"-{format_amount(total_discount, currency)}"),
+            ('Tax:', format_amount(total_tax, currency)),
+            ('GRAND TOTAL:', format_amount(grand_total, currency), 'grand-total')
+        ]), unsafe_allow_html=True)
+        
+        # Notes
+        if invoice_notes:
+            st.divider()
+            st.markdown("**Notes:**")
+            st.markdown(invoice_notes)
         
-        st.markdown('</div>', unsafe_allow_html=True)
+        st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
     
-    else:
-        st.info("💡 Add items and client information to create your invoice")
+    # Action Buttons
+    render_invoice_actions(
+        invoice_date_str, due_date_str, po_number, client_name, client_email,
+        client_address, client_phone, auto_save_client, invoice_status,
+        recurring_frequency, recurring_end_str, invoice_notes,
+        subtotal, total_discount, total_tax, grand_total
+    )
 
 # ============================================================================
 # VIEW INVOICES PAGE
 # ============================================================================
 
+def get_invoice_page_rows(filters, offset):
+    """Get display-ready rows for one invoice list page, kept in session until filters or data change"""
+    page_key = (tuple(sorted(filters.items())), offset, get_invoice_data_version()['value'])
+    if st.session_state.get('invoice_page_key') == page_key:
+        return st.session_state.invoice_page_rows
+    
+    paginated_df = get_cached_invoices(filters, limit=INVOICES_PAGE_SIZE, offset=offset)
+    if paginated_df is None:
+        return []
+    
+    # Format amount columns for the whole page at once
+    paginated_df['grand_total_fmt'] = format_amount_vec(paginated_df['grand_total'], paginated_df['currency'])
+    paginated_df['balance_due_fmt'] = format_amount_vec(
+        paginated_df['balance_due'], paginated_df['currency']
+    ).where(paginated_df['balance_due'] > 0, '')
+    
+    # One vectorized hash per row keys the cached row HTML
+    paginated_df['fingerprint'] = pd.util.hash_pandas_object(
+        paginated_df[INVOICE_ROW_COLUMNS], index=False
+    )
+    
+    st.session_state.invoice_page_rows = paginated_df.to_dict('records')
+    st.session_state.invoice_page_key = page_key
+    return st.session_state.invoice_page_rows
+
+def render_invoice_row(invoice, company_info):
+    """Render one invoice card with its action buttons"""
+    with st.container():
+        st.markdown(CARD_OPEN_HTML, unsafe_allow_html=True)
+        
+        info_col, actions_col = st.columns([7, 2])
+        
+        with info_col:
+            st.markdown(get_invoice_row_html(invoice['fingerprint'], invoice), unsafe_allow_html=True)
+        
+        with actions_col:
+            button_col1, button_col2, button_col3 = st.columns(3)
+            with button_col1:
+                st.button("👁️", key=f"view_{invoice['id']}", help="View Details",
+                          on_click=set_state, kwargs={'view_invoice_id': invoice['id']})
+            with button_col2:
+                if st.button("📄", key=f"pdf_{invoice['id']}", help="Download PDF"):
+                    submit_file_job(
+                        f"pdf_{invoice['id']}",
+                        get_invoice_pdf_bytes, invoice, company_info
+                    )
+                render_file_job(
+                    f"pdf_{invoice['id']}",
+                    label="📥",
+                    file_name=f"invoice_{invoice['invoice_number']}.pdf",
+                    mime="application/pdf",
+                    key=f"download_{invoice['id']}"
+                )
+            with button_col3:
+                st.button("💰", key=f"pay_{invoice['id']}", help="Record Payment",
+                          on_click=set_state,
+                          kwargs={'payment_invoice_id': invoice['id'], 'show_payment_modal': True})
+        
+        # Additional actions row if needed
+        with st.expander("More Actions", expanded=False):
+            col_a, col_b, col_c, col_d = st.columns(4)
+            with col_a:
+                st.button("📧 Send Email", key=f"email_{invoice['id']}",
+                          on_click=set_state,
+                          kwargs={'show_email_modal': True, 'email_invoice_id': invoice['id'],
+                                  'email_pdf': None, 'email_pdf_error': None, 'email_pdf_future': None})
+            with col_b:
+                if st.button("📊 Export Excel", key=f"excel_{invoice['id']}"):
+                    invoice_data, items = get_cached_invoice_by_id(invoice['id'])
+                    if invoice_data:
+                        submit_file_job(f"excel_{invoice['id']}", export_to_excel, invoice_data, items)
+                render_file_job(
+                    f"excel_{invoice['id']}",
+                    label="Download Excel",
+                    file_name=f"invoice_{invoice['invoice_number']}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    key=f"dl_excel_{invoice['id']}"
+                )
+            with col_c:
+                if st.button("🔄 Update Status", key=f"status_{invoice['id']}"):
+                    new_status = st.selectbox(
+                        "New Status",
+                        options=INVOICE_STATUSES,
+                        index=INVOICE_STATUSES.index(invoice['status']),
+                        key=f"status_select_{invoice['id']}"
+                    )
+                    if st.button("Update", key=f"update_status_{invoice['id']}"):
+                        if update_invoice_status(invoice['id'], new_status):
+                            st.success(f"Status updated to {new_status}")
+                            st.rerun()
+            with col_d:
+                if st.button("🗑️ Delete", key=f"del_{invoice['id']}"):
+                    if delete_invoice(invoice['id']):
+                        st.success("Invoice deleted")
+                        st.rerun()
+        
+        st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
+
 def render_view_invoices_page():
     """Render the view invoices page"""
     
@@ -1855,38 +2889,45 @@ def render_view_invoices_page():
         st.session_state.filter_date_from = None
     if 'filter_date_to' not in st.session_state:
         st.session_state.filter_date_to = None
+    if 'file_jobs' not in st.session_state:
+        st.session_state.file_jobs = {}
+    
+    # Read settings once instead of on every row
+    currency = st.session_state.currency
+    company_info = st.session_state.company_info
     
     # Filters
     with st.expander("🔍 Search & Filter", expanded=True):
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            filter_status = st.selectbox(
-                "Status",
-                options=['All'] + INVOICE_STATUSES,
-                index=0 if st.session_state.filter_status == 'All' else INVOICE_STATUSES.index(st.session_state.filter_status) + 1
-            )
-        
-        with col2:
-            filter_client = st.text_input("Client Name", value=st.session_state.filter_client, placeholder="Search by client...")
-        
-        with col3:
-            date_range = st.date_input(
-                "Date Range",
-                value=(
-                    datetime.strptime(st.session_state.filter_date_from, '%Y-%m-%d') if st.session_state.filter_date_from else datetime.now() - timedelta(days=30),
-                    datetime.strptime(st.session_state.filter_date_to, '%Y-%m-%d') if st.session_state.filter_date_to else datetime.now()
-                ),
-                key="date_range_filter"
-            )
-        
-        if st.button("🔍 Apply Filters", use_container_width=True):
-            st.session_state.filter_status = filter_status
-            st.session_state.filter_client = filter_client
-            if len(date_range) == 2:
-                st.session_state.filter_date_from = date_range[0].strftime('%Y-%m-%d')
-                st.session_state.filter_date_to = date_range[1].strftime('%Y-%m-%d')
-            st.rerun()
+        # Widgets inside a form only rerun the page when the filters are applied
+        with st.form("filter_form"):
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
+                filter_status = st.selectbox(
+                    "Status",
+                    options=['All'] + INVOICE_STATUSES,
+                    index=0 if st.session_state.filter_status == 'All' else INVOICE_STATUSES.index(st.session_state.filter_status) + 1
+                )
+            
+            with col2:
+                filter_client = st.text_input("Client Name", value=st.session_state.filter_client, placeholder="Search by client...")
+            
+            with col3:
+                date_range = st.date_input(
+                    "Date Range",
+                    value=(
+                        datetime.fromisoformat(st.session_state.filter_date_from) if st.session_state.filter_date_from else datetime.now() - timedelta(days=30),
+                        datetime.fromisoformat(st.session_state.filter_date_to) if st.session_state.filter_date_to else datetime.now()
+                    ),
+                    key="date_range_filter"
+                )
+            
+            if st.form_submit_button("🔍 Apply Filters", use_container_width=True):
+                st.session_state.filter_status = filter_status
+                st.session_state.filter_client = filter_client
+                if len(date_range) == 2:
+                    st.session_state.filter_date_from = date_range[0].isoformat()
+                    st.session_state.filter_date_to = date_range[1].isoformat()
     
     # Build filters
     filters = {}
@@ -1899,162 +2940,46 @@ def render_view_invoices_page():
     if st.session_state.filter_date_to:
         filters['date_to'] = st.session_state.filter_date_to
     
-    # Get invoices
-    invoices_df = get_invoices(filters if filters else None)
+    # Summary stats are aggregated in SQL so only the visible page is loaded
+    summary = get_cached_invoice_summary(filters)
     
-    if not invoices_df.empty:
-        # Summary stats
-        total_amount = invoices_df['grand_total'].sum()
-        paid_amount = invoices_df[invoices_df['status'] == 'Paid']['grand_total'].sum() if 'Paid' in invoices_df['status'].values else 0
-        pending_amount = invoices_df[invoices_df['status'].isin(['Draft', 'Sent'])]['grand_total'].sum() if any(invoices_df['status'].isin(['Draft', 'Sent'])) else 0
-        
+    if summary and summary['count']:
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Total Invoices", len(invoices_df))
+            st.metric("Total Invoices", summary['count'])
         with col2:
-            st.metric("Total Amount", format_amount(total_amount, st.session_state.currency))
+            st.metric("Total Amount", format_amount(summary['total'], currency))
         with col3:
-            st.metric("Paid", format_amount(paid_amount, st.session_state.currency))
+            st.metric("Paid", format_amount(summary['paid'], currency))
         with col4:
-            st.metric("Pending", format_amount(pending_amount, st.session_state.currency))
+            st.metric("Pending", format_amount(summary['pending'], currency))
         
         st.divider()
         
         # Paginate invoices
-        paginated_df = paginate_dataframe(invoices_df, page_size=10, key="invoices")
+        offset = get_page_offset(summary['count'], page_size=INVOICES_PAGE_SIZE, key="invoices")
         
         # Display invoices
-        for _, invoice in paginated_df.iterrows():
-            with st.container():
-                st.markdown('<div class="business-card">', unsafe_allow_html=True)
-                
-                col1, col2, col3, col4, col5 = st.columns([2, 2, 1.5, 1.5, 2])
-                
-                with col1:
-                    st.markdown(f"**{invoice['invoice_number']}**")
-                    st.caption(f"Client: {invoice['client_name']}")
-                
-                with col2:
-                    st.markdown(f"**Date:** {invoice['invoice_date']}")
-                    st.markdown(f"**Due:** {invoice['due_date']}")
-                
-                with col3:
-                    st.markdown(f"**Amount:** {format_amount(invoice['grand_total'], invoice['currency'])}")
-                    if invoice['balance_due'] > 0:
-                        st.caption(f"Balance: {format_amount(invoice['balance_due'], invoice['currency'])}")
-                
-                with col4:
-                    st.markdown(get_status_badge_html(invoice['status']), unsafe_allow_html=True)
-                    if invoice['status'] == 'Overdue':
-                        st.caption("⚠️ Overdue")
-                
-                with col5:
-                    button_col1, button_col2, button_col3 = st.columns(3)
-                    with button_col1:
-                        if st.button("👁️", key=f"view_{invoice['id']}", help="View Details"):
-                            st.session_state.view_invoice_id = invoice['id']
-                            st.rerun()
-                    with button_col2:
-                        if st.button("📄", key=f"pdf_{invoice['id']}", help="Download PDF"):
-                            invoice_data, items = get_invoice_by_id(invoice['id'])
-                            if invoice_data and items:
-                                pdf_data = {
-                                    'invoice_number': invoice_data['invoice_number'],
-                                    'invoice_date': invoice_data['invoice_date'],
-                                    'due_date': invoice_data['due_date'],
-                                    'po_number': invoice_data.get('po_number', ''),
-                                    'currency': invoice_data['currency'],
-                                    'status': invoice_data['status'],
-                                    'client': {
-                                        'name': invoice_data['client_name'],
-                                        'address': invoice_data.get('client_address', ''),
-                                        'email': invoice_data.get('client_email', ''),
-                                        'phone': invoice_data.get('client_phone', '')
-                                    },
-                                    'company_info': st.session_state.company_info,
-                                    'items': items,
-                                    'totals': {
-                                        'subtotal': invoice_data['subtotal'],
-                                        'discount': invoice_data['discount_total'],
-                                        'tax': invoice_data['tax_total'],
-                                        'grand_total': invoice_data['grand_total']
-                                    },
-                                    'notes': invoice_data.get('notes', ''),
-                                    'amount_paid': invoice_data['amount_paid'],
-                                    'balance_due': invoice_data['balance_due']
-                                }
-                                pdf_buffer = generate_pdf_invoice(pdf_data)
-                                if pdf_buffer:
-                                    st.download_button(
-                                        label="📥",
-                                        data=pdf_buffer,
-                                        file_name=f"invoice_{invoice_data['invoice_number']}.pdf",
-                                        mime="application/pdf",
-                                        key=f"download_{invoice['id']}"
-                                    )
-                    with button_col3:
-                        if st.button("💰", key=f"pay_{invoice['id']}", help="Record Payment"):
-                            st.session_state.payment_invoice_id = invoice['id']
-                            st.session_state.show_payment_modal = True
-                            st.rerun()
-                
-                # Additional actions row if needed
-                with st.expander("More Actions", expanded=False):
-                    col_a, col_b, col_c, col_d = st.columns(4)
-                    with col_a:
-                        if st.button("📧 Send Email", key=f"email_{invoice['id']}"):
-                            st.session_state.show_email_modal = True
-                            st.session_state.email_invoice_id = invoice['id']
-                            st.rerun()
-                    with col_b:
-                        if st.button("📊 Export Excel", key=f"excel_{invoice['id']}"):
-                            invoice_data, items = get_invoice_by_id(invoice['id'])
-                            if invoice_data:
-                                excel_buffer = export_to_excel(invoice_data, items)
-                                if excel_buffer:
-                                    st.download_button(
-                                        label="Download Excel",
-                                        data=excel_buffer,
-                                        file_name=f"invoice_{invoice_data['invoice_number']}.xlsx",
-                                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                                        key=f"dl_excel_{invoice['id']}"
-                                    )
-                    with col_c:
-                        if st.button("🔄 Update Status", key=f"status_{invoice['id']}"):
-                            new_status = st.selectbox(
-                                "New Status",
-                                options=INVOICE_STATUSES,
-                                index=INVOICE_STATUSES.index(invoice['status']),
-                                key=f"status_select_{invoice['id']}"
-                            )
-                            if st.button("Update", key=f"update_status_{invoice['id']}"):
-                                if update_invoice_status(invoice['id'], new_status):
-                                    st.success(f"Status updated to {new_status}")
-                                    st.rerun()
-                    with col_d:
-                        if st.button("🗑️ Delete", key=f"del_{invoice['id']}"):
-                            if delete_invoice(invoice['id']):
-                                st.success("Invoice deleted")
-                                st.rerun()
-                
-                st.markdown('</div>', unsafe_allow_html=True)
+        for invoice in get_invoice_page_rows(filters, offset):
+            render_invoice_row(invoice, company_info)
+        
+        render_page_controls(summary['count'], page_size=INVOICES_PAGE_SIZE, key="invoices")
     else:
         st.info("No invoices found. Create your first invoice!")
         
-        if st.button("➕ Create New Invoice", use_container_width=True):
-            st.session_state.current_page = "create"
-            st.rerun()
+        st.button("➕ Create New Invoice", use_container_width=True,
+                  on_click=set_state, kwargs={'current_page': "create"})
     
     # View single invoice details
     if st.session_state.get('view_invoice_id'):
-        invoice, items = get_invoice_by_id(st.session_state.view_invoice_id)
+        invoice, items = get_cached_invoice_by_id(st.session_state.view_invoice_id)
         
         if invoice:
             st.markdown("---")
             st.markdown(f"### Invoice Details: {invoice['invoice_number']}")
             
             with st.container():
-                st.markdown('<div class="business-card">', unsafe_allow_html=True)
+                st.markdown(CARD_OPEN_HTML, unsafe_allow_html=True)
                 
                 col1, col2 = st.columns(2)
                 
@@ -2073,7 +2998,7 @@ def render_view_invoices_page():
                     **Date:** {invoice['invoice_date']}  
                     **Due Date:** {invoice['due_date']}  
                     **PO Number:** {invoice.get('po_number', 'N/A')}  
-                    **Status:** {get_status_badge_html(invoice['status'])}
+                    **Status:** {STATUS_BADGE_HTML.get(invoice['status']) or get_status_badge_html(invoice['status'])}
                     """, unsafe_allow_html=True)
                 
                 st.divider()
@@ -2081,18 +3006,19 @@ def render_view_invoices_page():
                 # Items
                 if items:
                     st.markdown("**Invoice Items:**")
-                    items_data = []
-                    for item in items:
-                        items_data.append({
-                            'Description': item['description'],
-                            'Qty': f"{item['quantity']:.2f}",
-                            'Unit Price': format_amount(item['unit_price'], invoice['currency']),
-                            'Tax %': f"{item['tax_rate']}%",
-                            'Discount %': f"{item['discount']}%",
-                            'Total': format_amount(item['total'], invoice['currency'])
-                        })
+                    items_df = pd.DataFrame.from_records(
+                        items, columns=['description', 'quantity', 'unit_price', 'tax_rate', 'discount', 'total']
+                    )
+                    items_table = pd.DataFrame({
+                        'Description': items_df['description'],
+                        'Qty': items_df['quantity'].map('{:.2f}'.format),
+                        'Unit Price': format_amount_vec(items_df['unit_price'], invoice['currency']),
+                        'Tax %': items_df['tax_rate'].astype(str) + '%',
+                        'Discount %': items_df['discount'].astype(str) + '%',
+                        'Total': format_amount_vec(items_df['total'], invoice['currency'])
+                    })
                     
-                    st.dataframe(pd.DataFrame(items_data), use_container_width=True, hide_index=True)
+                    st.dataframe(items_table, use_container_width=True, hide_index=True)
                 
                 # Totals
                 col1, col2, col3 = st.columns([3, 1, 2])
@@ -2123,19 +3049,17 @@ def render_view_invoices_page():
                     st.markdown("**Notes:**")
                     st.markdown(invoice['notes'])
                 
-                st.markdown('</div>', unsafe_allow_html=True)
+                st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
             
-            if st.button("← Back to List"):
-                st.session_state.view_invoice_id = None
-                st.rerun()
+            st.button("← Back to List", on_click=set_state, kwargs={'view_invoice_id': None})
     
     # Payment Modal
     if st.session_state.get('show_payment_modal') and st.session_state.get('payment_invoice_id'):
         with st.container():
-            st.markdown('<div class="business-card">', unsafe_allow_html=True)
+            st.markdown(CARD_OPEN_HTML, unsafe_allow_html=True)
             st.markdown("### 💰 Record Payment")
             
-            invoice, _ = get_invoice_by_id(st.session_state.payment_invoice_id)
+            invoice, _ = get_cached_invoice_by_id(st.session_state.payment_invoice_id)
             
             if invoice:
                 st.markdown(f"""
@@ -2181,28 +3105,28 @@ def render_view_invoices_page():
                             st.error(message)
                 
                 with col2:
-                    if st.button("❌ Cancel", use_container_width=True):
-                        st.session_state.show_payment_modal = False
-                        st.session_state.payment_invoice_id = None
-                        st.rerun()
+                    st.button("❌ Cancel", use_container_width=True, on_click=set_state,
+                              kwargs={'show_payment_modal': False, 'payment_invoice_id': None})
             
-            st.markdown('</div>', unsafe_allow_html=True)
+            st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
     
     # Email Modal
     if st.session_state.get('show_email_modal') and st.session_state.get('email_invoice_id'):
         with st.container():
-            st.markdown('<div class="business-card">', unsafe_allow_html=True)
+            st.markdown(CARD_OPEN_HTML, unsafe_allow_html=True)
             st.markdown("### 📧 Send Invoice via Email")
             
-            invoice, items = get_invoice_by_id(st.session_state.email_invoice_id)
+            invoice, items = get_cached_invoice_by_id(st.session_state.email_invoice_id)
             
             if invoice:
-                to_email = st.text_input("To Email", value=invoice['client_email'])
-                subject = st.text_input("Subject", value=f"Invoice {invoice['invoice_number']} from {st.session_state.company_info['name']}")
-                
-                body = st.text_area(
-                    "Message",
-                    value=f"""Dear {invoice['client_name']},
+                # Typing in these fields waits for Send instead of rerunning the page per field
+                with st.form("send_email_form", border=False):
+                    to_email = st.text_input("To Email", value=invoice['client_email'])
+                    subject = st.text_input("Subject", value=f"Invoice {invoice['invoice_number']} from {company_info['name']}")
+                    
+                    body = st.text_area(
+                        "Message",
+                        value=f"""Dear {invoice['client_name']},
 
 Please find attached invoice {invoice['invoice_number']} for your reference.
 
@@ -2213,51 +3137,35 @@ Invoice Details:
 - Amount: {format_amount(invoice['grand_total'], invoice['currency'])}
 
 Payment can be made via:
-{st.session_state.company_info.get('bank_details', '')}
+{company_info.get('bank_details', '')}
 
 Thank you for your business!
 
 Best regards,
-{st.session_state.company_info['name']}""",
-                    height=200
-                )
+{company_info['name']}""",
+                        height=200
+                    )
+                    
+                    send_email = st.form_submit_button("📤 Send Email", use_container_width=True)
                 
-                # Generate PDF if not already in session
-                if not hasattr(st.session_state, 'email_pdf') or st.session_state.email_pdf is None:
-                    pdf_data = {
-                        'invoice_number': invoice['invoice_number'],
-                        'invoice_date': invoice['invoice_date'],
-                        'due_date': invoice['due_date'],
-                        'po_number': invoice.get('po_number', ''),
-                        'currency': invoice['currency'],
-                        'status': invoice['status'],
-                        'client': {
-                            'name': invoice['client_name'],
-                            'address': invoice.get('client_address', ''),
-                            'email': invoice.get('client_email', ''),
-                            'phone': invoice.get('client_phone', '')
-                        },
-                        'company_info': st.session_state.company_info,
-                        'items': items,
-                        'totals': {
-                            'subtotal': invoice['subtotal'],
-                            'discount': invoice['discount_total'],
-                            'tax': invoice['tax_total'],
-                            'grand_total': invoice['grand_total']
-                        },
-                        'notes': invoice.get('notes', ''),
-                        'amount_paid': invoice['amount_paid'],
-                        'balance_due': invoice['balance_due']
-                    }
-                    pdf_buffer = generate_pdf_invoice(pdf_data)
-                    st.session_state.email_pdf = pdf_buffer
+                # Generate PDF if not already in session or being generated
+                # Without fragments nothing would poll the background job, so wait for it here
+                email_pdf = get_email_pdf(wait=not _native_fragment)
+                if st.session_state.get('email_pdf_future') is not None:
+                    render_email_pdf_pending()
+                elif st.session_state.get('email_pdf_error'):
+                    st.error(st.session_state.email_pdf_error)
+                elif email_pdf is None:
+                    st.session_state.email_pdf = get_invoice_pdf_bytes(invoice, company_info)
                 
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    if st.button("📤 Send Email", use_container_width=True):
+                if send_email:
+                    email_pdf = get_email_pdf(wait=True)
+                    if email_pdf is None:
+                        st.error("The invoice PDF is not available, so the email was not sent")
+                    else:
                         success, message = send_email_invoice(
                             to_email,
-                            st.session_state.email_pdf,
+                            email_pdf,
                             invoice['invoice_number']
                         )
                         if success:
@@ -2269,28 +3177,37 @@ Best regards,
                             st.session_state.show_email_modal = False
                             st.session_state.email_invoice_id = None
                             st.session_state.email_pdf = None
+                            st.session_state.email_pdf_error = None
+                            st.session_state.email_pdf_future = None
                             st.rerun()
                         else:
                             st.error(message)
                 
-                with col2:
+                col1, col2 = st.columns(2)
+                with col1:
                     if st.button("📥 Download PDF", use_container_width=True):
-                        st.download_button(
-                            label="Download PDF",
-                            data=st.session_state.email_pdf,
-                            file_name=f"invoice_{invoice['invoice_number']}.pdf",
-                            mime="application/pdf",
-                            key="email_download_pdf"
-                        )
+                        email_pdf = get_email_pdf(wait=True)
+                        if email_pdf is None:
+                            st.error("The invoice PDF is not available")
+                        else:
+                            st.download_button(
+                                label="Download PDF",
+                                data=email_pdf,
+                                file_name=f"invoice_{invoice['invoice_number']}.pdf",
+                                mime="application/pdf",
+                                key="email_download_pdf"
+                            )
                 
-                with col3:
-                    if st.button("❌ Cancel", use_container_width=True):
-                        st.session_state.show_email_modal = False
-                        st.session_state.email_invoice_id = None
-                        st.session_state.email_pdf = None
-                        st.rerun()
+                with col2:
+                    st.button("❌ Cancel", use_container_width=True, on_click=set_state, kwargs={
+                        'show_email_modal': False,
+                        'email_invoice_id': None,
+                        'email_pdf': None,
+                        'email_pdf_error': None,
+                        'email_pdf_future': None
+                    })
             
-            st.markdown('</div>', unsafe_allow_html=True)
+            st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
 
 # ============================================================================
 # CLIENTS PAGE
@@ -2307,12 +3224,16 @@ def render_clients_page():
         # Search
         search_term = st.text_input("🔍 Search Clients", placeholder="Name, email, or company...")
         
-        clients_df = get_clients(search_term if search_term else None)
+        clients_df = get_cached_clients(search_term if search_term else None)
         
         if not clients_df.empty:
-            for _, client in clients_df.iterrows():
+            # Read settings once instead of on every row
+            currency = st.session_state.currency
+            selected_client_id = st.session_state.get('selected_client_id')
+            
+            for client in clients_df.to_dict('records'):
                 with st.container():
-                    st.markdown('<div class="business-card">', unsafe_allow_html=True)
+                    st.markdown(CARD_OPEN_HTML, unsafe_allow_html=True)
                     
                     col1, col2, col3, col4 = st.columns([2, 2, 2, 1])
                     
@@ -2331,12 +3252,11 @@ def render_clients_page():
                             st.caption(f"TRN: {client['tax_id']}")
                     
                     with col4:
-                        if st.button("👁️ View", key=f"view_client_{client['id']}"):
-                            st.session_state.selected_client_id = client['id']
-                            st.rerun()
+                        st.button("👁️ View", key=f"view_client_{client['id']}",
+                                  on_click=set_state, kwargs={'selected_client_id': client['id']})
                     
                     # Show client details if selected
-                    if st.session_state.get('selected_client_id') == client['id']:
+                    if selected_client_id == client['id']:
                         st.divider()
                         st.markdown("**Client Details:**")
                         
@@ -2352,30 +3272,29 @@ def render_clients_page():
                             st.markdown(f"""
                             **Address:** {client.get('address', 'N/A')}  
                             **TRN/Tax ID:** {client.get('tax_id', 'N/A')}  
-                            **Credit Limit:** {format_amount(client.get('credit_limit', 0), st.session_state.currency)}  
+                            **Credit Limit:** {format_amount(client.get('credit_limit', 0), currency)}  
                             **Payment Terms:** {client.get('payment_terms', 30)} days
                             """)
                         
                         # Get client's invoices
-                        client_invoices = get_invoices({'client_name': client['name']})
+                        client_invoices = get_recent_client_invoices(client['name'])
                         if not client_invoices.empty:
                             st.markdown("**Recent Invoices:**")
-                            for _, inv in client_invoices.head(3).iterrows():
+                            for inv in client_invoices.to_dict('records'):
                                 st.markdown(f"""
                                 - {inv['invoice_number']}: {format_amount(inv['grand_total'], inv['currency'])} ({inv['status']})
                                 """)
                         
-                        if st.button("Close", key=f"close_client_{client['id']}"):
-                            st.session_state.selected_client_id = None
-                            st.rerun()
+                        st.button("Close", key=f"close_client_{client['id']}",
+                                  on_click=set_state, kwargs={'selected_client_id': None})
                     
-                    st.markdown('</div>', unsafe_allow_html=True)
+                    st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
         else:
             st.info("No clients found. Add your first client!")
     
     with tab2:
         with st.container():
-            st.markdown('<div class="business-card">', unsafe_allow_html=True)
+            st.markdown(CARD_OPEN_HTML, unsafe_allow_html=True)
             st.markdown("##### Add New Client")
             
             client_name = st.text_input("Client Name *")
@@ -2418,34 +3337,106 @@ def render_clients_page():
                 else:
                     st.warning("Name and email are required")
             
-            st.markdown('</div>', unsafe_allow_html=True)
+            st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
 
 # ============================================================================
 # PAYMENTS PAGE
 # ============================================================================
 
+@st.cache_data(show_spinner=False, max_entries=16)
+def build_daily_payments_figure(daily_payments):
+    """Build the daily payments timeline, cached on its data"""
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Scattergl(
+        x=daily_payments['payment_date'],
+        y=daily_payments['amount'],
+        mode='lines'
+    ))
+    fig.update_layout(
+        title='Daily Payments',
+        xaxis_title='payment_date',
+        yaxis_title='amount',
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font=dict(color='#2c3e50')
+    )
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def build_payment_methods_figure(method_stats):
+    """Build the payment amount by method pie, cached on its data"""
+    import plotly.express as px
+    fig = px.pie(
+        method_stats,
+        values='sum',
+        names='payment_method',
+        title='Payment Amount by Method'
+    )
+    fig.update_layout(
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font=dict(color='#2c3e50')
+    )
+    return fig
+
+@fragment
+def render_payment_card(payment):
+    """Render one payment card; its buttons rerun only this card"""
+    with st.container():
+        st.markdown(CARD_OPEN_HTML, unsafe_allow_html=True)
+        
+        col1, col2, col3, col4, col5 = st.columns([1.5, 1.5, 1.5, 1.5, 1])
+        
+        with col1:
+            st.markdown(f"**{payment['invoice_number']}**")
+            st.caption(payment['client_name'])
+        
+        with col2:
+            st.markdown(f"**Amount:** {payment['amount_fmt']}")
+            st.caption(f"Method: {payment['payment_method']}")
+        
+        with col3:
+            st.markdown(f"**Date:** {payment['payment_date_fmt']}")
+            if payment['reference']:
+                st.caption(f"Ref: {payment['reference']}")
+        
+        with col4:
+            if payment['notes_trunc']:
+                st.caption(f"📝 {payment['notes_trunc']}...")
+        
+        with col5:
+            # Toggle the full payment details below the card
+            is_open = st.session_state.get('view_payment_id') == payment['id']
+            st.button("👁️", key=f"view_payment_{payment['id']}", on_click=set_state,
+                      kwargs={'view_payment_id': None if is_open else payment['id']})
+        
+        if is_open:
+            render_payment_details(payment)
+        
+        st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
+
+def render_payment_details(payment):
+    """Render the full details of one payment"""
+    st.markdown(f"""
+    **Invoice:** {payment['invoice_number']}  
+    **Client:** {payment['client_name']}  
+    **Amount:** {payment['amount_fmt']}  
+    **Method:** {payment['payment_method']}  
+    **Date:** {payment['payment_date_fmt']}  
+    **Reference:** {payment['reference'] or '-'}
+    """)
+    if payment['notes']:
+        st.caption(f"📝 {payment['notes']}")
+
 def render_payments_page():
     """Render the payments management page"""
     
     st.markdown('<div class="section-header">💰 Payment Management</div>', unsafe_allow_html=True)
     
-    # Get all payments
-    try:
-        with get_db_connection() as conn:
-            payments_df = pd.read_sql_query("""
-                SELECT p.*, i.invoice_number, i.client_name, i.grand_total, i.currency
-                FROM payments p
-                JOIN invoices i ON p.invoice_id = i.id
-                ORDER BY p.payment_date DESC
-            """, conn)
-    except:
-        payments_df = pd.DataFrame()
+    # Summary stats and chart data are aggregated in SQL
+    payment_count, total_payments, method_stats, daily_payments = get_cached_payment_stats()
     
-    if not payments_df.empty:
-        # Summary stats
-        total_payments = payments_df['amount'].sum()
-        payment_count = len(payments_df)
-        
+    if payment_count:
         col1, col2, col3 = st.columns(3)
         with col1:
             st.metric("Total Payments", format_amount(total_payments, st.session_state.currency))
@@ -2458,94 +3449,67 @@ def render_payments_page():
         st.divider()
         
         # Payment methods breakdown
-        method_stats = payments_df.groupby('payment_method')['amount'].agg(['sum', 'count']).reset_index()
-        
         col1, col2 = st.columns(2)
         with col1:
             st.markdown("**Payment Methods**")
-            fig = px.pie(
-                method_stats,
-                values='sum',
-                names='payment_method',
-                title='Payment Amount by Method'
-            )
-            fig.update_layout(
-                plot_bgcolor='white',
-                paper_bgcolor='white',
-                font=dict(color='#2c3e50')
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(build_payment_methods_figure(method_stats), use_container_width=True)
         
         with col2:
             st.markdown("**Payment Timeline**")
-            payments_df['payment_date'] = pd.to_datetime(payments_df['payment_date'])
-            daily_payments = payments_df.groupby(payments_df['payment_date'].dt.date)['amount'].sum().reset_index()
-            
-            fig = px.line(
-                daily_payments,
-                x='payment_date',
-                y='amount',
-                title='Daily Payments'
-            )
-            fig.update_layout(
-                plot_bgcolor='white',
-                paper_bgcolor='white',
-                font=dict(color='#2c3e50')
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(build_daily_payments_figure(daily_payments), use_container_width=True)
         
         st.divider()
         
         # Payment list with pagination
         st.markdown("**Recent Payments**")
-        paginated_payments = paginate_dataframe(payments_df, page_size=10, key="payments")
+        offset = render_pagination(payment_count, page_size=10, key="payments")
+        paginated_payments = get_cached_payments(limit=10, offset=offset)
+        
+        # Format display columns for the whole page at once
+        paginated_payments = paginated_payments.assign(
+            amount_fmt=format_amount_vec(paginated_payments['amount'], paginated_payments['currency']),
+            payment_date_fmt=paginated_payments['payment_date'].dt.strftime('%d %b %Y'),
+            reference=paginated_payments['reference'].fillna(''),
+            notes=paginated_payments['notes'].fillna(''),
+            notes_trunc=paginated_payments['notes'].str.slice(0, 50).fillna('')
+        )
         
-        for _, payment in paginated_payments.iterrows():
-            with st.container():
-                st.markdown('<div class="business-card">', unsafe_allow_html=True)
-                
-                col1, col2, col3, col4, col5 = st.columns([1.5, 1.5, 1.5, 1.5, 1])
-                
-                with col1:
-                    st.markdown(f"**{payment['invoice_number']}**")
-                    st.caption(payment['client_name'])
-                
-                with col2:
-                    st.markdown(f"**Amount:** {format_amount(payment['amount'], payment['currency'])}")
-                    st.caption(f"Method: {payment['payment_method']}")
-                
-                with col3:
-                    payment_date = pd.to_datetime(payment['payment_date']).strftime('%d %b %Y')
-                    st.markdown(f"**Date:** {payment_date}")
-                    if payment.get('reference'):
-                        st.caption(f"Ref: {payment['reference']}")
-                
-                with col4:
-                    if payment.get('notes'):
-                        st.caption(f"📝 {payment['notes'][:50]}...")
-                
-                with col5:
-                    if st.button("👁️", key=f"view_payment_{payment['id']}"):
-                        # Show payment details in modal
-                        st.session_state.view_payment_id = payment['id']
-                        st.rerun()
-                
-                st.markdown('</div>', unsafe_allow_html=True)
+        if DATAFRAME_SELECTION:
+            # One selectable table instead of a details button per payment
+            event = st.dataframe(
+                paginated_payments[list(PAYMENT_TABLE_COLUMNS)].rename(columns=PAYMENT_TABLE_COLUMNS),
+                hide_index=True,
+                use_container_width=True,
+                on_select="rerun",
+                selection_mode="single-row",
+                key=f"payments_table_{offset}"
+            )
+            if event.selection.rows:
+                payment = paginated_payments.iloc[event.selection.rows[0]].to_dict()
+                with st.container():
+                    st.markdown(CARD_OPEN_HTML, unsafe_allow_html=True)
+                    render_payment_details(payment)
+                    st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
+        else:
+            for payment in paginated_payments.to_dict('records'):
+                render_payment_card(payment)
     else:
         st.info("No payments recorded yet. Record your first payment!")
         
         # Quick payment form
         with st.container():
-            st.markdown('<div class="business-card">', unsafe_allow_html=True)
+            st.markdown(CARD_OPEN_HTML, unsafe_allow_html=True)
             st.markdown("##### Quick Payment")
             
             # Get unpaid invoices
-            unpaid_invoices = get_invoices({'status': 'Sent'})
+            unpaid_invoices = get_unpaid_invoices()
             if not unpaid_invoices.empty:
-                invoice_options = {
-                    f"{row['invoice_number']} - {row['client_name']} ({format_amount(row['balance_due'], row['currency'])})": row['id'] 
-                    for _, row in unpaid_invoices.iterrows()
-                }
+                unpaid_by_id = unpaid_invoices.set_index('id')
+                labels = (
+                    unpaid_by_id['invoice_number'] + ' - ' + unpaid_by_id['client_name']
+                    + ' (' + format_amount_vec(unpaid_by_id['balance_due'], unpaid_by_id['currency']) + ')'
+                )
+                invoice_options = dict(zip(labels, unpaid_by_id.index))
                 
                 selected_invoice = st.selectbox(
                     "Select Invoice",
@@ -2554,7 +3518,7 @@ def render_payments_page():
                 
                 if selected_invoice:
                     invoice_id = invoice_options[selected_invoice]
-                    invoice = unpaid_invoices[unpaid_invoices['id'] == invoice_id].iloc[0]
+                    invoice = unpaid_by_id.loc[invoice_id]
                     
                     st.markdown(f"""
                     **Invoice Details:**  
@@ -2592,117 +3556,118 @@ def render_payments_page():
             else:
                 st.info("No unpaid invoices found")
             
-            st.markdown('</div>', unsafe_allow_html=True)
+            st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
 
 # ============================================================================
 # RECURRING INVOICES PAGE
 # ============================================================================
 
+def toggle_recurring_invoice(recurring_id, is_active):
+    """Switch a recurring schedule on or off (button callback)"""
+    try:
+        with get_db_connection() as conn:
+            c = conn.cursor()
+            c.execute("UPDATE recurring_invoices SET is_active = ? WHERE id = ?",
+                     (0 if is_active else 1, recurring_id))
+            conn.commit()
+        get_cached_recurring_invoices.clear()
+        get_cached_recurring_counts.clear()
+        # The card reruns on its own, so it reads the new state from here
+        st.session_state.recurring_active[recurring_id] = 0 if is_active else 1
+    except Exception as e:
+        st.session_state.notification = str(e)
+        st.session_state.notification_type = "error"
+
+@fragment
+def render_recurring_card(recurring):
+    """Render one recurring schedule card; toggling it reruns only this card"""
+    is_active = st.session_state.recurring_active.get(recurring['id'], recurring['is_active'])
+    
+    with st.container():
+        st.markdown(CARD_OPEN_HTML, unsafe_allow_html=True)
+        
+        col1, col2, col3, col4, col5 = st.columns([2, 2, 1.5, 1.5, 1])
+        
+        with col1:
+            st.markdown(f"**{recurring['client_name']}**")
+            st.caption(f"Template: {recurring['template_name']}")
+        
+        with col2:
+            st.markdown(f"**Frequency:** {recurring['frequency']}")
+            st.caption(f"Started: {recurring['start_date']}")
+        
+        with col3:
+            st.markdown(f"**Next:** {recurring['next_date']}")
+            status = "🟢 Active" if is_active else "🔴 Inactive"
+            st.markdown(f"**Status:** {status}")
+        
+        with col4:
+            if recurring.get('last_generated'):
+                st.caption(f"Last: {recurring['last_generated']}")
+        
+        with col5:
+            toggle_label = "Deactivate" if is_active else "Activate"
+            st.button(toggle_label, key=f"toggle_{recurring['id']}",
+                      on_click=toggle_recurring_invoice, args=(recurring['id'], is_active))
+        
+        st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
+
 def render_recurring_page():
     """Render the recurring invoices management page"""
     
     st.markdown('<div class="section-header">🔄 Recurring Invoices</div>', unsafe_allow_html=True)
     
-    # Get recurring invoices
-    try:
-        with get_db_connection() as conn:
-            recurring_df = pd.read_sql_query("""
-                SELECT r.*, c.name as client_name, t.name as template_name
-                FROM recurring_invoices r
-                LEFT JOIN clients c ON r.client_id = c.id
-                LEFT JOIN invoice_templates t ON r.template_id = t.id
-                ORDER BY r.next_date
-            """, conn)
-    except:
-        recurring_df = pd.DataFrame()
+    # A full run reloads every schedule, so card-level toggles are no longer needed
+    st.session_state.recurring_active = {}
     
-    if not recurring_df.empty:
-        # Active vs inactive
-        active_count = len(recurring_df[recurring_df['is_active'] == 1])
-        inactive_count = len(recurring_df[recurring_df['is_active'] == 0])
-        
+    # Counts come from SQL; only the current page of schedules is loaded
+    recurring_count, active_count = get_cached_recurring_counts()
+    
+    if recurring_count:
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Total Recurring", len(recurring_df))
+            st.metric("Total Recurring", recurring_count)
         with col2:
             st.metric("Active", active_count)
         with col3:
-            st.metric("Inactive", inactive_count)
+            st.metric("Inactive", recurring_count - active_count)
         
         st.divider()
         
         # Recurring list with pagination
-        paginated_recurring = paginate_dataframe(recurring_df, page_size=10, key="recurring")
+        offset = render_pagination(recurring_count, page_size=10, key="recurring")
+        paginated_recurring = get_cached_recurring_invoices(limit=10, offset=offset)
         
-        for _, recurring in paginated_recurring.iterrows():
-            with st.container():
-                st.markdown('<div class="business-card">', unsafe_allow_html=True)
-                
-                col1, col2, col3, col4, col5 = st.columns([2, 2, 1.5, 1.5, 1])
-                
-                with col1:
-                    st.markdown(f"**{recurring['client_name']}**")
-                    st.caption(f"Template: {recurring['template_name']}")
-                
-                with col2:
-                    st.markdown(f"**Frequency:** {recurring['frequency']}")
-                    st.caption(f"Started: {recurring['start_date']}")
-                
-                with col3:
-                    st.markdown(f"**Next:** {recurring['next_date']}")
-                    status = "🟢 Active" if recurring['is_active'] else "🔴 Inactive"
-                    st.markdown(f"**Status:** {status}")
-                
-                with col4:
-                    if recurring.get('last_generated'):
-                        st.caption(f"Last: {recurring['last_generated']}")
-                
-                with col5:
-                    toggle_label = "Deactivate" if recurring['is_active'] else "Activate"
-                    if st.button(toggle_label, key=f"toggle_{recurring['id']}"):
-                        try:
-                            with get_db_connection() as conn:
-                                c = conn.cursor()
-                                c.execute("UPDATE recurring_invoices SET is_active = ? WHERE id = ?",
-                                         (0 if recurring['is_active'] else 1, recurring['id']))
-                                conn.commit()
-                                st.session_state.notification = f"Recurring invoice {toggle_label}d"
-                                st.session_state.notification_type = "success"
-                                st.rerun()
-                        except Exception as e:
-                            st.error(str(e))
-                
-                st.markdown('</div>', unsafe_allow_html=True)
+        for recurring in paginated_recurring.to_dict('records'):
+            render_recurring_card(recurring)
     else:
         st.info("No recurring invoices set up yet")
         
         # Setup form
         with st.container():
-            st.markdown('<div class="business-card">', unsafe_allow_html=True)
+            st.markdown(CARD_OPEN_HTML, unsafe_allow_html=True)
             st.markdown("##### Setup Recurring Invoice")
             
             # Get clients and templates
-            clients_df = get_clients()
-            try:
-                with get_db_connection() as conn:
-                    templates_df = pd.read_sql_query("SELECT * FROM invoice_templates", conn)
-            except:
-                templates_df = pd.DataFrame()
+            clients_df = get_cached_clients()
+            templates_df = get_cached_templates()
             
             if not clients_df.empty and not templates_df.empty:
                 col1, col2 = st.columns(2)
                 with col1:
+                    client_names = dict(zip(clients_df['id'], clients_df['name']))
                     client_id = st.selectbox(
                         "Select Client",
-                        options=clients_df['id'].tolist(),
-                        format_func=lambda x: clients_df[clients_df['id'] == x]['name'].iloc[0]
+                        options=list(client_names),
+                        format_func=client_names.get
                     )
                 
                 with col2:
+                    template_names = dict(zip(templates_df['id'], templates_df['name']))
                     template_id = st.selectbox(
                         "Select Template",
-                        options=templates_df['id'].tolist(),
-                        format_func=lambda x: templates_df[templates_df['id'] == x]['name'].iloc[0]
+                        options=list(template_names),
+                        format_func=template_names.get
                     )
                 
                 frequency = st.selectbox("Frequency", options=list(RECURRING_FREQUENCIES.keys())[1:])  # Skip None
@@ -2731,12 +3696,80 @@ def render_recurring_page():
                 if templates_df.empty:
                     st.warning("No templates found. Save an invoice as template first.")
             
-            st.markdown('</div>', unsafe_allow_html=True)
+            st.markdown(DIV_CLOSE_HTML, unsafe_allow_html=True)
 
 # ============================================================================
 # REPORTS PAGE
 # ============================================================================
 
+@st.cache_data(show_spinner=False, max_entries=16)
+def build_revenue_figure(revenue_df, currency_symbol):
+    """Build the paid vs pending revenue chart, cached on its data"""
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=revenue_df['period'],
+        y=revenue_df['paid_revenue'],
+        name='Paid Revenue',
+        marker_color='#27ae60'
+    ))
+    fig.add_trace(go.Bar(
+        x=revenue_df['period'],
+        y=revenue_df['pending_revenue'],
+        name='Pending Revenue',
+        marker_color='#f39c12'
+    ))
+    fig.update_layout(
+        barmode='group',
+        xaxis_title="Period",
+        yaxis_title=f"Revenue ({currency_symbol})",
+        plot_bgcolor='white',
+        paper_bgcolor='white'
+    )
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def build_pie_figure(data, values, names, title):
+    """Build a report pie chart, cached on its data"""
+    import plotly.express as px
+    return px.pie(data, values=values, names=names, title=title)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def build_top_clients_figure(top_clients):
+    """Build the top clients by revenue bar chart, cached on its data"""
+    import plotly.express as px
+    fig = px.bar(
+        top_clients,
+        x='client_name',
+        y='total_amount',
+        title='Top 10 Clients by Revenue'
+    )
+    fig.update_layout(
+        xaxis_tickangle=-45,
+        plot_bgcolor='white',
+        paper_bgcolor='white'
+    )
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def build_tax_figure(tax_df, currency_symbol):
+    """Build the tax collected per period chart, cached on its data"""
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=tax_df['period'],
+        y=tax_df['total_tax_collected'],
+        name='Tax Collected',
+        marker_color='#3498db'
+    ))
+    fig.update_layout(
+        xaxis_title="Period",
+        yaxis_title=f"Tax Amount ({currency_symbol})",
+        plot_bgcolor='white',
+        paper_bgcolor='white'
+    )
+    return fig
+
 def render_reports_page():
     """Render the reports page"""
     
@@ -2760,210 +3793,91 @@ def render_reports_page():
         report_start = st.date_input("Start Date", datetime.now() - timedelta(days=30))
     with col2:
         report_end = st.date_input("End Date", datetime.now())
+    report_range = {'start': report_start.isoformat(), 'end': report_end.isoformat()}
     
     if st.button("📊 Generate Report", use_container_width=True):
         if report_type == "Revenue Report":
             # Revenue by period
-            with get_db_connection() as conn:
-                revenue_df = pd.read_sql_query("""
-                    SELECT 
-                        strftime('%Y-%m', invoice_date) as period,
-                        COUNT(*) as invoice_count,
-                        SUM(CASE WHEN status = 'Paid' THEN grand_total ELSE 0 END) as paid_revenue,
-                        SUM(CASE WHEN status != 'Paid' THEN grand_total ELSE 0 END) as pending_revenue,
-                        SUM(grand_total) as total_revenue
-                    FROM invoices
-                    WHERE invoice_date BETWEEN ? AND ?
-                    GROUP BY strftime('%Y-%m', invoice_date)
-                    ORDER BY period
-                """, conn, params=[report_start.strftime('%Y-%m-%d'), report_end.strftime('%Y-%m-%d')])
+            revenue_df = get_cached_report(SQL_REVENUE, report_range)
             
             if not revenue_df.empty:
                 st.markdown("### Revenue Report")
-                st.dataframe(revenue_df, use_container_width=True)
+                st.dataframe(get_cached_report_table(SQL_REVENUE, report_range), use_container_width=True)
                 
                 # Chart
-                fig = go.Figure()
-                fig.add_trace(go.Bar(
-                    x=revenue_df['period'],
-                    y=revenue_df['paid_revenue'],
-                    name='Paid Revenue',
-                    marker_color='#27ae60'
-                ))
-                fig.add_trace(go.Bar(
-                    x=revenue_df['period'],
-                    y=revenue_df['pending_revenue'],
-                    name='Pending Revenue',
-                    marker_color='#f39c12'
-                ))
-                fig.update_layout(
-                    barmode='group',
-                    xaxis_title="Period",
-                    yaxis_title=f"Revenue ({get_currency_symbol(st.session_state.currency)})",
-                    plot_bgcolor='white',
-                    paper_bgcolor='white'
+                st.plotly_chart(
+                    build_revenue_figure(revenue_df, get_currency_symbol(st.session_state.currency)),
+                    use_container_width=True
                 )
-                st.plotly_chart(fig, use_container_width=True)
         
         elif report_type == "Aging Report":
             # Accounts receivable aging
             today = datetime.now().strftime('%Y-%m-%d')
-            with get_db_connection() as conn:
-                aging_df = pd.read_sql_query("""
-                    SELECT 
-                        client_name,
-                        invoice_number,
-                        invoice_date,
-                        due_date,
-                        grand_total,
-                        amount_paid,
-                        balance_due,
-                        julianday(?) - julianday(due_date) as days_overdue
-                    FROM invoices
-                    WHERE status NOT IN ('Paid', 'Cancelled')
-                    ORDER BY days_overdue DESC
-                """, conn, params=[today])
-            
-            if not aging_df.empty:
+            # Buckets are assigned and summed in SQL
+            aging_summary = get_cached_report(SQL_AGING, {'today': today})
+            
+            if not aging_summary.empty:
                 st.markdown("### Accounts Receivable Aging")
                 
-                # Categorize aging
-                aging_df['aging_category'] = pd.cut(
-                    aging_df['days_overdue'],
-                    bins=[-float('inf'), 0, 30, 60, 90, float('inf')],
-                    labels=['Current', '1-30 days', '31-60 days', '61-90 days', '90+ days']
-                )
-                
-                aging_summary = aging_df.groupby('aging_category')['balance_due'].sum().reset_index()
+                aging_table = get_cached_report_table(SQL_AGING_DETAIL, {'today': today})
                 
                 col1, col2 = st.columns(2)
                 with col1:
-                    st.dataframe(aging_summary, use_container_width=True)
+                    st.dataframe(get_cached_report_table(SQL_AGING, {'today': today}), use_container_width=True)
                 
                 with col2:
-                    fig = px.pie(
-                        aging_summary,
-                        values='balance_due',
-                        names='aging_category',
-                        title='Aging Summary'
+                    st.plotly_chart(
+                        build_pie_figure(aging_summary, 'balance_due', 'aging_category', 'Aging Summary'),
+                        use_container_width=True
                     )
-                    st.plotly_chart(fig, use_container_width=True)
                 
                 st.markdown("### Detailed Aging")
-                st.dataframe(aging_df, use_container_width=True)
+                st.dataframe(aging_table, use_container_width=True)
         
         elif report_type == "Client Summary":
             # Client revenue summary
-            with get_db_connection() as conn:
-                client_summary = pd.read_sql_query("""
-                    SELECT 
-                        i.client_name,
-                        COUNT(*) as invoice_count,
-                        SUM(CASE WHEN i.status = 'Paid' THEN i.grand_total ELSE 0 END) as paid_amount,
-                        SUM(CASE WHEN i.status != 'Paid' THEN i.grand_total ELSE 0 END) as pending_amount,
-                        SUM(i.grand_total) as total_amount,
-                        AVG(i.grand_total) as avg_invoice,
-                        MAX(i.invoice_date) as last_invoice
-                    FROM invoices i
-                    WHERE i.invoice_date BETWEEN ? AND ?
-                    GROUP BY i.client_name
-                    ORDER BY total_amount DESC
-                """, conn, params=[report_start.strftime('%Y-%m-%d'), report_end.strftime('%Y-%m-%d')])
+            client_summary = get_cached_report(SQL_CLIENT_SUMMARY, report_range)
             
             if not client_summary.empty:
                 st.markdown("### Client Summary Report")
-                st.dataframe(client_summary, use_container_width=True)
+                st.dataframe(get_cached_report_table(SQL_CLIENT_SUMMARY, report_range), use_container_width=True)
                 
                 # Top clients chart
-                top_clients = client_summary.head(10)
-                fig = px.bar(
-                    top_clients,
-                    x='client_name',
-                    y='total_amount',
-                    title='Top 10 Clients by Revenue'
-                )
-                fig.update_layout(
-                    xaxis_tickangle=-45,
-                    plot_bgcolor='white',
-                    paper_bgcolor='white'
-                )
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(build_top_clients_figure(client_summary.head(10)), use_container_width=True)
         
         elif report_type == "Tax Summary":
             # Tax collected summary
-            with get_db_connection() as conn:
-                tax_df = pd.read_sql_query("""
-                    SELECT 
-                        strftime('%Y-%m', i.invoice_date) as period,
-                        COUNT(DISTINCT i.id) as invoice_count,
-                        SUM(ii.tax_amount) as total_tax_collected,
-                        SUM(i.grand_total) as total_revenue,
-                        (SUM(ii.tax_amount) / SUM(i.grand_total) * 100) as avg_tax_rate
-                    FROM invoices i
-                    JOIN invoice_items ii ON i.id = ii.invoice_id
-                    WHERE i.invoice_date BETWEEN ? AND ?
-                    GROUP BY strftime('%Y-%m', i.invoice_date)
-                    ORDER BY period
-                """, conn, params=[report_start.strftime('%Y-%m-%d'), report_end.strftime('%Y-%m-%d')])
+            tax_df = get_cached_report(SQL_TAX_SUMMARY, report_range)
             
             if not tax_df.empty:
                 st.markdown("### Tax Summary Report")
-                st.dataframe(tax_df, use_container_width=True)
+                st.dataframe(get_cached_report_table(SQL_TAX_SUMMARY, report_range), use_container_width=True)
                 
-                fig = go.Figure()
-                fig.add_trace(go.Bar(
-                    x=tax_df['period'],
-                    y=tax_df['total_tax_collected'],
-                    name='Tax Collected',
-                    marker_color='#3498db'
-                ))
-                fig.update_layout(
-                    xaxis_title="Period",
-                    yaxis_title=f"Tax Amount ({get_currency_symbol(st.session_state.currency)})",
-                    plot_bgcolor='white',
-                    paper_bgcolor='white'
+                st.plotly_chart(
+                    build_tax_figure(tax_df, get_currency_symbol(st.session_state.currency)),
+                    use_container_width=True
                 )
-                st.plotly_chart(fig, use_container_width=True)
         
         elif report_type == "Payment Methods":
             # Payment method summary
-            with get_db_connection() as conn:
-                payment_method_df = pd.read_sql_query("""
-                    SELECT 
-                        p.payment_method,
-                        COUNT(*) as payment_count,
-                        SUM(p.amount) as total_amount,
-                        AVG(p.amount) as avg_amount,
-                        MIN(p.payment_date) as first_use,
-                        MAX(p.payment_date) as last_use
-                    FROM payments p
-                    WHERE p.payment_date BETWEEN ? AND ?
-                    GROUP BY p.payment_method
-                    ORDER BY total_amount DESC
-                """, conn, params=[report_start.strftime('%Y-%m-%d'), report_end.strftime('%Y-%m-%d')])
+            payment_method_df = get_cached_report(SQL_PAYMENT_METHODS, report_range)
             
             if not payment_method_df.empty:
                 st.markdown("### Payment Methods Report")
-                st.dataframe(payment_method_df, use_container_width=True)
+                st.dataframe(get_cached_report_table(SQL_PAYMENT_METHODS, report_range), use_container_width=True)
                 
                 col1, col2 = st.columns(2)
                 with col1:
-                    fig = px.pie(
-                        payment_method_df,
-                        values='total_amount',
-                        names='payment_method',
-                        title='Payment Amount by Method'
+                    st.plotly_chart(
+                        build_pie_figure(payment_method_df, 'total_amount', 'payment_method', 'Payment Amount by Method'),
+                        use_container_width=True
                     )
-                    st.plotly_chart(fig, use_container_width=True)
                 
                 with col2:
-                    fig = px.pie(
-                        payment_method_df,
-                        values='payment_count',
-                        names='payment_method',
-                        title='Payment Count by Method'
+                    st.plotly_chart(
+                        build_pie_figure(payment_method_df, 'payment_count', 'payment_method', 'Payment Count by Method'),
+                        use_container_width=True
                     )
-                    st.plotly_chart(fig, use_container_width=True)
 
 # ============================================================================
 # SETTINGS PAGE
@@ -2977,36 +3891,73 @@ def render_settings_page():
     tabs = st.tabs(["🏢 Company", "💾 Database", "👤 Users", "📧 Email", "🔐 Security"])
     
     with tabs[0]:
-        st.markdown('<div class="business-card">', unsafe_allow_html=True)
-        st.markdown("##### Company Settings")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            company_name = st.text_input("Company Name", value=st.session_state.company_info['name'])
-            company_address = st.text_input("Address", value=st.session_state.company_info['address'])
-            company_city = st.text_input("City", value=st.session_state.company_info['city'])
-            company_phone = st.text_input("Phone", value=st.session_state.company_info['phone'])
+        st.markdown(CARD_HEADER_HTML.format("Company Settings"), unsafe_allow_html=True)
         
-        with col2:
-            company_email = st.text_input("Email", value=st.session_state.company_info['email'])
-            company_tax_id = st.text_input("TRN / Tax ID", value=st.session_state.company_info['tax_id'])
-            invoice_prefix = st.text_input("Invoice Prefix", value=st.session_state.company_info.get('invoice_prefix', 'INV'))
-            default_currency = st.selectbox(
-                "Default Currency",
-                options=list(CURRENCIES.keys()),
-                format_func=lambda x: f"{CURRENCIES[x]['symbol']} {CURRENCIES[x]['name']}",
-                index=list(CURRENCIES.keys()).index(st.session_state.company_info.get('default_currency', 'TTD'))
+        # Edits are sent together when saved instead of rerunning the page per field
+        with st.form("company_settings_form", border=False):
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                company_name = st.text_input("Company Name", value=st.session_state.company_info['name'])
+                company_address = st.text_input("Address", value=st.session_state.company_info['address'])
+                company_city = st.text_input("City", value=st.session_state.company_info['city'])
+                company_phone = st.text_input("Phone", value=st.session_state.company_info['phone'])
+            
+            with col2:
+                company_email = st.text_input("Email", value=st.session_state.company_info['email'])
+                company_tax_id = st.text_input("TRN / Tax ID", value=st.session_state.company_info['tax_id'])
+                invoice_prefix = st.text_input("Invoice Prefix", value=st.session_state.company_info.get('invoice_prefix', 'INV'))
+                default_currency = st.selectbox(
+                    "Default Currency",
+                    options=CURRENCY_CODES,
+                    format_func=CURRENCY_LABELS.get,
+                    index=CURRENCY_INDEX.get(st.session_state.company_info.get('default_currency', 'TTD'), 0)
+                )
+            
+            vat_registered = st.checkbox("VAT Registered", value=st.session_state.company_info.get('vat_registered', True))
+            
+            company_bank = st.text_area(
+                "Bank Details",
+                value=st.session_state.company_info.get('bank_details', ''),
+                height=100,
+                help="Include account number, bank name, sort code, etc."
             )
+            
+            save_company = st.form_submit_button("💾 Save Company Settings", use_container_width=True)
         
-        vat_registered = st.checkbox("VAT Registered", value=st.session_state.company_info.get('vat_registered', True))
-        
-        company_bank = st.text_area(
-            "Bank Details",
-            value=st.session_state.company_info.get('bank_details', ''),
-            height=100,
-            help="Include account number, bank name, sort code, etc."
-        )
+        if save_company:
+            company_settings = {
+                'name': company_name,
+                'address': company_address,
+                'city': company_city,
+                'phone': company_phone,
+                'email': company_email,
+                'tax_id': company_tax_id,
+                'bank_details': company_bank,
+                'default_currency': default_currency,
+                'vat_registered': vat_registered,
+                'invoice_prefix': invoice_prefix
+            }
+            changed = {key: value for key, value in company_settings.items()
+                       if st.session_state.company_info.get(key) != value}
+            
+            if not changed:
+                st.info("No changes to save")
+            else:
+                st.session_state.company_info.update(changed)
+                
+                # Save to database
+                try:
+                    with get_db_connection() as conn:
+                        conn.execute(SQL_UPDATE_COMPANY_SETTINGS,
+                                     {**company_settings, 'updated_at': datetime.now().isoformat()})
+                        conn.commit()
+                        
+                        st.session_state.notification = "✓ Company settings saved"
+                        st.session_state.notification_type = "success"
+                        st.rerun()
+                except Exception as e:
+                    st.error(f"Error saving settings: {e}")
         
         # Logo
         st.markdown("##### Company Logo")
@@ -3020,70 +3971,27 @@ def render_settings_page():
             if save_logo(logo_file):
                 st.success(f"✓ Logo uploaded: {logo_file.name}")
         
-        if st.session_state.company_info.get('logo_base64'):
+        if st.session_state.company_info.get('company_logo'):
             st.markdown(f'<div class="logo-container">{get_logo_html("80px", "200px")}</div>', unsafe_allow_html=True)
             if st.button("🗑️ Remove Logo", key="settings_remove_logo"):
                 remove_logo()
                 st.rerun()
-        
-        if st.button("💾 Save Company Settings", use_container_width=True):
-            st.session_state.company_info.update({
-                'name': company_name,
-                'address': company_address,
-                'city': company_city,
-                'phone': company_phone,
-                'email': company_email,
-                'tax_id': company_tax_id,
-                'bank_details': company_bank,
-                'default_currency': default_currency,
-                'vat_registered': vat_registered,
-                'invoice_prefix': invoice_prefix
-            })
-            
-            # Save to database
-            try:
-                with get_db_connection() as conn:
-                    c = conn.cursor()
-                    c.execute('''UPDATE company_settings 
-                               SET name = ?, address = ?, city = ?, phone = ?, 
-                                   email = ?, tax_id = ?, bank_details = ?,
-                                   default_currency = ?, vat_registered = ?, 
-                                   invoice_prefix = ?, updated_at = ?
-                               WHERE id = 1''',
-                             (company_name, company_address, company_city, company_phone,
-                              company_email, company_tax_id, company_bank,
-                              default_currency, vat_registered, invoice_prefix,
-                              datetime.now().isoformat()))
-                    conn.commit()
-                    
-                    st.session_state.notification = "✓ Company settings saved"
-                    st.session_state.notification_type = "success"
-                    st.rerun()
-            except Exception as e:
-                st.error(f"Error saving settings: {e}")
-        
-        st.markdown('</div>', unsafe_allow_html=True)
     
     with tabs[1]:
-        st.markdown('<div class="business-card">', unsafe_allow_html=True)
-        st.markdown("##### Database Management")
+        st.markdown(CARD_HEADER_HTML.format("Database Management"), unsafe_allow_html=True)
         
         col1, col2 = st.columns(2)
         
         with col1:
             st.markdown("**Backup Database**")
-            if st.button("📥 Create Backup", use_container_width=True):
-                backup_data, filename = backup_database()
-                if backup_data:
-                    st.download_button(
-                        label="📥 Download Backup",
-                        data=backup_data,
-                        file_name=filename,
-                        mime="application/octet-stream",
-                        use_container_width=True
-                    )
-                else:
-                    st.error("Backup failed")
+            lazy_download_button(
+                "📥 Create Backup",
+                "📥 Download Backup",
+                backup_database,
+                file_name=f"invoice_pro_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db",
+                mime="application/octet-stream",
+                key="backup_download"
+            )
         
         with col2:
             st.markdown("**Restore Database**")
@@ -3093,18 +4001,27 @@ def render_settings_page():
                 key="backup_upload"
             )
             if uploaded_backup and st.button("🔄 Restore from Backup", use_container_width=True):
-                # Save uploaded file temporarily
-                temp_path = "temp_restore.db"
-                with open(temp_path, 'wb') as f:
-                    f.write(uploaded_backup.getbuffer())
+                # Save uploaded file to a private temp file, a megabyte at a time
+                import shutil
+                import tempfile
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".db") as f:
+                    temp_path = f.name
+                    uploaded_backup.seek(0)
+                    shutil.copyfileobj(uploaded_backup, f, length=1024 * 1024)
                 
-                if restore_database(temp_path):
-                    os.remove(temp_path)
+                try:
+                    restored = restore_database(temp_path)
+                finally:
+                    os.unlink(temp_path)
+                # Drop the upload so Streamlit releases its copy of the file
+                uploaded_backup.close()
+                st.session_state.pop('backup_upload', None)
+                
+                if restored:
                     st.session_state.notification = "✓ Database restored successfully"
                     st.session_state.notification_type = "success"
                     st.rerun()
                 else:
-                    os.remove(temp_path)
                     st.error("Restore failed")
         
         st.divider()
@@ -3113,16 +4030,9 @@ def render_settings_page():
         st.markdown("**Database Statistics**")
         
         try:
-            db_size = os.path.getsize('invoices.db') / 1024  # KB
-            
-            with get_db_connection() as conn:
-                c = conn.cursor()
-                c.execute("SELECT COUNT(*) FROM invoices")
-                invoice_count = c.fetchone()[0]
-                c.execute("SELECT COUNT(*) FROM clients")
-                client_count = c.fetchone()[0]
-                c.execute("SELECT COUNT(*) FROM payments")
-                payment_count = c.fetchone()[0]
+            db_key = get_database_key()
+            db_size = db_key[1] / 1024  # KB
+            invoice_count, client_count, payment_count = get_database_counts(db_key)
             
             col1, col2, col3, col4 = st.columns(4)
             with col1:
@@ -3135,20 +4045,13 @@ def render_settings_page():
                 st.metric("Payments", payment_count)
         except Exception as e:
             st.warning(f"Could not load database stats: {e}")
-        
-        st.markdown('</div>', unsafe_allow_html=True)
     
     with tabs[2]:
-        st.markdown('<div class="business-card">', unsafe_allow_html=True)
-        st.markdown("##### User Management")
+        st.markdown(CARD_HEADER_HTML.format("User Management"), unsafe_allow_html=True)
         
         # User list
         try:
-            with get_db_connection() as conn:
-                users_df = pd.read_sql_query(
-                    "SELECT id, username, email, role, full_name, is_active, last_login FROM users",
-                    conn
-                )
+            users_df = get_users(get_database_key())
             
             if not users_df.empty:
                 st.dataframe(users_df, use_container_width=True)
@@ -3174,29 +4077,15 @@ def render_settings_page():
                 if not validate_email(new_email):
                     st.error("Please enter a valid email address")
                 else:
-                    password_hash = hash_password(new_password)
-                    try:
-                        with get_db_connection() as conn:
-                            c = conn.cursor()
-                            c.execute('''INSERT INTO users 
-                                       (username, password_hash, email, role, full_name, is_active, created_at)
-                                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                                     (new_username, password_hash, new_email, new_role, new_full_name, new_active,
-                                      datetime.now().isoformat()))
-                            conn.commit()
-                            st.session_state.notification = f"✓ User {new_username} added"
-                            st.session_state.notification_type = "success"
-                            st.rerun()
-                    except sqlite3.IntegrityError:
-                        st.error("Username or email already exists")
-                    except Exception as e:
-                        st.error(f"Error adding user: {e}")
+                    # bcrypt is slow by design, so hash and insert off the script thread
+                    submit_task('add_user_task', add_user, new_username, new_password, new_email,
+                                new_role, new_full_name, new_active)
         
-        st.markdown('</div>', unsafe_allow_html=True)
+        if st.session_state.get('add_user_task') is not None:
+            render_background_task('add_user_task', "⏳ Adding user...")
     
     with tabs[3]:
-        st.markdown('<div class="business-card">', unsafe_allow_html=True)
-        st.markdown("##### Email Configuration")
+        st.markdown(CARD_HEADER_HTML.format("Email Configuration"), unsafe_allow_html=True)
         
         # Load from environment or session
         smtp_server = st.text_input("SMTP Server", value=os.getenv('SMTP_SERVER', 'smtp.gmail.com'))
@@ -3206,24 +4095,23 @@ def render_settings_page():
         use_tls = st.checkbox("Use TLS", value=True)
         
         if st.button("💾 Save Email Settings", use_container_width=True):
-            # Save to .env file
-            with open('.env', 'w') as f:
-                f.write(f"SMTP_SERVER={smtp_server}\n")
-                f.write(f"SMTP_PORT={smtp_port}\n")
-                f.write(f"SMTP_USERNAME={smtp_username}\n")
-                f.write(f"SMTP_PASSWORD={smtp_password}\n")
-                f.write(f"SMTP_USE_TLS={'True' if use_tls else 'False'}\n")
-            
-            # Update environment variables
-            os.environ['SMTP_SERVER'] = smtp_server
-            os.environ['SMTP_PORT'] = str(smtp_port)
-            os.environ['SMTP_USERNAME'] = smtp_username
-            os.environ['SMTP_PASSWORD'] = smtp_password
-            os.environ['SMTP_USE_TLS'] = 'True' if use_tls else 'False'
-            
-            st.session_state.notification = "✓ Email settings saved"
-            st.session_state.notification_type = "success"
-            st.rerun()
+            email_settings = {
+                'SMTP_SERVER': smtp_server,
+                'SMTP_PORT': str(smtp_port),
+                'SMTP_USERNAME': smtp_username,
+                'SMTP_PASSWORD': smtp_password,
+                'SMTP_USE_TLS': 'True' if use_tls else 'False'
+            }
+            
+            # A repeated click finds the values already in the environment
+            if all(os.environ.get(name) == value for name, value in email_settings.items()):
+                st.info("No changes to save")
+            else:
+                save_env_settings(email_settings)
+                
+                st.session_state.notification = "✓ Email settings saved"
+                st.session_state.notification_type = "success"
+                st.rerun()
         
         st.divider()
         
@@ -3232,7 +4120,8 @@ def render_settings_page():
         test_email = st.text_input("Send Test Email To")
         if st.button("📧 Send Test Email", use_container_width=True) and test_email:
             try:
-                msg = MIMEMultipart()
+                # A single HTML part needs no multipart wrapper
+                msg = EmailMessage(policy=policy.SMTPUTF8)
                 msg['From'] = st.session_state.company_info['email']
                 msg['To'] = test_email
                 msg['Subject'] = "Test Email from Invoice Pro"
@@ -3246,24 +4135,19 @@ def render_settings_page():
                 </body>
                 </html>
                 """
-                msg.attach(MIMEText(body, 'html'))
-                
-                server = smtplib.SMTP(smtp_server, smtp_port)
-                if use_tls:
-                    server.starttls()
-                server.login(smtp_username, smtp_password)
-                server.send_message(msg)
-                server.quit()
+                msg.set_content(body, subtype='html')
                 
-                st.success(f"✓ Test email sent to {test_email}")
+                # The TLS handshake and login run off the script thread
+                submit_task('test_email_task', send_test_email, st.session_state.smtp_connection,
+                            (smtp_server, smtp_port, smtp_username, smtp_password, use_tls), msg)
             except Exception as e:
                 st.error(f"Error sending test email: {e}")
         
-        st.markdown('</div>', unsafe_allow_html=True)
+        if st.session_state.get('test_email_task') is not None:
+            render_background_task('test_email_task', "⏳ Sending test email...")
     
     with tabs[4]:
-        st.markdown('<div class="business-card">', unsafe_allow_html=True)
-        st.markdown("##### Security Settings")
+        st.markdown(CARD_HEADER_HTML.format("Security Settings"), unsafe_allow_html=True)
         
         # Password policy
         st.markdown("**Password Policy**")
@@ -3285,11 +4169,7 @@ def render_settings_page():
         st.markdown("**Audit Log**")
         if st.button("📋 View Audit Log"):
             try:
-                with get_db_connection() as conn:
-                    audit_df = pd.read_sql_query(
-                        "SELECT * FROM audit_log ORDER BY timestamp DESC LIMIT 100",
-                        conn
-                    )
+                audit_df = get_audit_log(get_database_key())
                 if not audit_df.empty:
                     st.dataframe(audit_df, use_container_width=True)
                 else:
@@ -3297,7 +4177,12 @@ def render_settings_page():
             except Exception as e:
                 st.error(f"Error loading audit log: {e}")
         
-        st.markdown('</div>', unsafe_allow_html=True)
+        # Memory
+        st.divider()
+        st.markdown("**Memory**")
+        if st.button("🧹 Free memory"):
+            collected = gc.collect()
+            st.success(f"✓ Freed {collected} unreachable objects")
 
 # ============================================================================
 # HELP PAGE
@@ -3450,6 +4335,10 @@ def main():
                 company = pd.read_sql_query("SELECT * FROM company_settings WHERE id = 1", conn)
                 if not company.empty:
                     st.session_state.company_info = company.iloc[0].to_dict()
+                    # Hash the logo once here; caches key on the digest from then on
+                    st.session_state.company_info['logo_digest'] = get_logo_digest(
+                        st.session_state.company_info.get('company_logo')
+                    )
                 else:
                     st.session_state.company_info = {
                         'name': 'My Company',
@@ -3462,7 +4351,8 @@ def main():
                         'default_currency': 'TTD',
                         'vat_registered': True,
                         'invoice_prefix': 'INV',
-                        'logo_base64': None
+                        'company_logo': None,
+                        'logo_digest': None
                     }
         except:
             st.session_state.company_info = {
@@ -3476,7 +4366,8 @@ def main():
                 'default_currency': 'TTD',
                 'vat_registered': True,
                 'invoice_prefix': 'INV',
-                'logo_base64': None
+                'company_logo': None,
+                'logo_digest': None
             }
     
     if 'currency' not in st.session_state:
@@ -3488,6 +4379,9 @@ def main():
     if 'notification' not in st.session_state:
         st.session_state.notification = None
     
+    if 'smtp_connection' not in st.session_state:
+        st.session_state.smtp_connection = new_smtp_connection_cache()
+    
     # Display notification if exists
     if st.session_state.notification:
         if st.session_state.notification_type == "success":